@@ -1,12 +1,32 @@
 import os
 import time
 import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from openpyxl import Workbook
 import warnings
 from Enola.route import QuantumRouter
 from DasAtom_fun import *
 import argparse
 
+# Columns of the summary rows returned by SingleFileProcessor.process_qasm_file
+SUMMARY_HEADER = [
+    'QASM File',
+    'Num Qubits',
+    'Num CZ Gates',
+    'Circuit Depth',
+    'Fidelity',
+    'Movement Fidelity',
+    'Num Movement Ops',
+    'Num Transferred Qubits',
+    'Num Moves',
+    'Total Move Distance',
+    'Num Gate Cycles',
+    'Num Partitions',
+    'Elapsed Time (s)',
+    'Total_T (from fidelity calc)',
+    'Idle Time'
+]
+
 class SingleFileProcessor:
     """
     A helper class responsible for processing a single QASM file. This class:
@@ -27,11 +47,19 @@ class SingleFileProcessor:
         extended_radius: int,
         result_path: str,
         embeddings_path: str,
-        partitions_path: str,
         read_embeddings: bool,
         save_partitions_and_embeddings: bool,
         save_circuit_results: bool,
-        save_benchmark_results: bool
+        save_benchmark_results: bool,
+        routing_workers: int = 1,
+        profile: bool = False,
+        cache_dir: str = None,
+        cache_max_mb: float = 1024,
+        embedding_options: dict = None,
+        result_format: str = "xlsx",
+        save_schedule: bool = False,
+        circuit: LayeredCircuit = None,
+        partitions: list = None
     ):
         """
         Initialize the processor with file-specific and benchmark-wide parameters.
@@ -42,12 +70,21 @@ class SingleFileProcessor:
         :param interaction_radius: The interaction radius (Rb).
         :param extended_radius: The extended interaction radius (2 * Rb).
         :param result_path: Path to the parent results folder.
-        :param embeddings_path: Path to the folder where embeddings are read/saved.
-        :param partitions_path: Path to the folder where partitions are read/saved.
+        :param embeddings_path: Path to the folder where the embedding stores (embeddings and partitions) are read/saved.
         :param read_embeddings: Whether to read embeddings from existing files (instead of computing).
         :param save_partitions_and_embeddings: Whether to save newly created partitions/embeddings to disk.
         :param save_circuit_results: Whether to save circuit-level results (xlsx).
         :param save_benchmark_results: Whether to save the overall benchmark-level results.
+        :param routing_workers: Number of worker processes used to route the partition transitions.
+        :param profile: Whether to time each stage and write a per-file JSON profile next to the results.
+        :param cache_dir: Folder of the content-addressed partition/embedding cache (None disables it).
+        :param cache_max_mb: Size limit of the cache folder in MiB.
+        :param embedding_options: Hyper-parameters passed to get_embeddings (defaults when None).
+        :param result_format: Format of the circuit-level results: "xlsx", "csv" or "jsonl".
+        :param save_schedule: Whether to write the move schedule to a binary '.moves' file.
+        :param circuit: The already parsed and layered circuit of this file (parsed from QASM when None).
+        :param partitions: The already computed partitions of this circuit at this interaction radius
+                           (read, cached or computed when None).
         """
         self.qasm_filename = qasm_filename
         self.circuit_folder = circuit_folder
@@ -56,14 +93,28 @@ class SingleFileProcessor:
         self.extended_radius = extended_radius
         self.result_path = result_path
         self.embeddings_path = embeddings_path
-        self.partitions_path = partitions_path
         self.read_embeddings = read_embeddings
         self.save_partitions_and_embeddings = save_partitions_and_embeddings
         self.save_circuit_results = save_circuit_results
         self.save_benchmark_results = save_benchmark_results
-
-        # Used to store logs for the final XLSX per file
+        self.routing_workers = routing_workers
+        self.profile = profile
+        self.compile_cache = CompileCache(cache_dir, int(cache_max_mb * 2**20)) if cache_dir else None
+        self.embedding_options = resolve_embedding_options(**(embedding_options or {}))
+
+        self.result_format = result_format
+        self.save_schedule = save_schedule
+        self.circuit = circuit
+        self.partitions = partitions
+
+        # Summary rows of this file; they are also streamed, together with the
+        # schedule rows, to the circuit-level result sink
         self.file_process_log = []
+        self.result_sink = NullSink()
+
+    def _log(self, row):
+        self.file_process_log.append(row)
+        self.result_sink.write_row(row)
 
     def process_qasm_file(self):
         """
@@ -72,93 +123,130 @@ class SingleFileProcessor:
             2. Partitions the circuit and obtains embeddings.
             3. Generates parallel gates and qubit-movement sequences.
             4. Computes fidelity metrics.
-            5. Saves logs to a per-file Excel sheet (if configured).
+            5. Streams logs to a per-file result sink (if configured).
 
         :return: A list of metrics to be appended as a row in the main (benchmark-wide) workbook.
         """
-        wb = Workbook()
-        ws = wb.active
+        profiler.enabled = self.profile
+        profiler.reset()
+        try:
+            return self._process_qasm_file()
+        finally:
+            profiler.enabled = False
+            # Flushes and closes the circuit-level results if the file failed before step 9
+            self.result_sink.close()
+            self.result_sink = NullSink()
+
+    def _process_qasm_file(self):
         start_time = time.time()
-
-        # 1) Create circuit from QASM, then extract 2-qubit gates and DAG
-        qasm_circuit = CreateCircuitFromQASM(self.qasm_filename, self.circuit_folder)
-        two_qubit_gates_list = get_2q_gates_list(qasm_circuit)
+        if self.save_circuit_results:
+            self.result_sink = open_result_sink(
+                os.path.join(self.result_path, f'{self.qasm_filename}_rb{self.interaction_radius:.3g}'),
+                self.result_format
+            )
+        iso_hits, iso_misses = iso_cache.hits, iso_cache.misses
+
+        # 1) Extract 2-qubit gates from QASM (streamed when possible) and their ASAP layers
+        with profiler.stage('load_gates'):
+            if self.circuit is not None:
+                two_qubit_gates_list = self.circuit.gate_list()
+            else:
+                two_qubit_gates_list = load_2q_gates_list(self.qasm_filename, self.circuit_folder)
         assert two_qubit_gates_list, f"a wrong circuit which have no cz in {self.qasm_filename}"
-        qc_object, dag_object = gates_list_to_QC(two_qubit_gates_list)
+        with profiler.stage('layering'):
+            circuit = self.circuit if self.circuit is not None else LayeredCircuit(two_qubit_gates_list)
+            gate_layer_list = circuit.layers()
+        circuit_depth = len(gate_layer_list)
 
         # 2) Determine key architecture parameters
         num_qubits, num_cz_gates, grid_size = self._compute_architecture_parameters(two_qubit_gates_list)
 
-        # 3) Generate coupling graph based on the interaction radius
-        coupling_graph = self._generate_coupling_graph(grid_size)
+        # 3) Generate the architecture (coupling graph) based on the interaction radius
+        with profiler.stage('architecture'):
+            architecture = self._generate_architecture(grid_size)
 
         # 4) Get or create partitions
-        partitioned_gates = self._retrieve_or_generate_partitions(self.qasm_filename, coupling_graph, dag_object)
+        gates_digest = gate_list_digest(two_qubit_gates_list)
+        store = self._load_embedding_store(self.qasm_filename, gates_digest) if self.read_embeddings else None
+        with profiler.stage('partitioning'):
+            partitioned_gates = self._retrieve_or_generate_partitions(
+                architecture, gate_layer_list, gates_digest, store
+            )
 
         # 5) Get or create embeddings
-        embeddings, grid_size = self._retrieve_or_generate_embeddings(
-            self.qasm_filename,
-            partitioned_gates,
-            coupling_graph,
-            num_qubits,
-            grid_size
-        )
+        with profiler.stage('embedding'):
+            embeddings, grid_size = self._retrieve_or_generate_embeddings(
+                self.qasm_filename,
+                partitioned_gates,
+                architecture,
+                num_qubits,
+                grid_size,
+                gates_digest,
+                store
+            )
 
-        # 6) Generate parallel gates and all movement operations
-        parallel_gates, movements_list, merged_parallel_gates = self._compute_gates_and_movements(
+        # 6) Generate parallel gates and all movement operations, accumulating the
+        #    fidelity/time metrics as they are produced
+        fidelity_model = FidelityAccumulator(num_qubits, num_cz_gates)
+        num_gate_cycles = self._compute_gates_and_movements(
             num_qubits,
             partitioned_gates,
             embeddings,
-            coupling_graph,
-            grid_size
+            architecture.graph,
+            grid_size,
+            fidelity_model
         )
 
-        # 7) Compute fidelity/time metrics
+        # 7) Compute fidelity/time metrics on the final grid
         total_time_now = time.time()
-        idle_time, fidelity, move_fidelity, total_runtime, num_transfers, num_moves, total_move_distance = compute_fidelity(
-            merged_parallel_gates,
-            movements_list,
-            num_qubits,
-            num_cz_gates
-        )
+        self._log(["Final grid size", grid_size])
+        with profiler.stage('fidelity'):
+            idle_time, fidelity, move_fidelity, total_runtime, num_transfers, num_moves, total_move_distance = fidelity_model.result()
 
         # 8) Log final stats for this file
-        self.file_process_log.append(["Total processing time", total_time_now - start_time])
-        self.file_process_log.append(["Original circuit depth", qc_object.depth()])
-        self.file_process_log.append(["Fidelity", fidelity])
-        self.file_process_log.append(["Idle time", idle_time])
-        self.file_process_log.append(["Movement fidelity", move_fidelity])
-        self.file_process_log.append(["Movement operations", len(movements_list)])
-        self.file_process_log.append(["Parallel gate groups", len(merged_parallel_gates)])
-        self.file_process_log.append(["Number of partitions", len(embeddings)])
-        self.file_process_log.append(["Num of qubit moves (transfers)", num_transfers])
-        self.file_process_log.append(["Num of final re-locations (moves)", num_moves])
-        self.file_process_log.append(["Total move distance", total_move_distance])
-        self.file_process_log.append(["Total run time", total_time_now - start_time])
-
-        # 9) Optionally save a per-file XLSX
-        save_file_name = os.path.join(
-            self.result_path,
-            f'{self.qasm_filename}_rb{self.interaction_radius:.3g}.xlsx'
-        )
-        for item in self.file_process_log:
-            ws.append(item)
-        if self.save_circuit_results:
-            wb.save(save_file_name)
+        self._log(["Total processing time", total_time_now - start_time])
+        self._log(["Original circuit depth", circuit_depth])
+        self._log(["Fidelity", fidelity])
+        self._log(["Idle time", idle_time])
+        self._log(["Movement fidelity", move_fidelity])
+        self._log(["Movement operations", fidelity_model.num_stages])
+        self._log(["Parallel gate groups", num_gate_cycles])
+        self._log(["Number of partitions", len(embeddings)])
+        self._log(["Num of qubit moves (transfers)", num_transfers])
+        self._log(["Num of final re-locations (moves)", num_moves])
+        self._log(["Total move distance", total_move_distance])
+        file_iso_hits = iso_cache.hits - iso_hits
+        file_iso_queries = file_iso_hits + iso_cache.misses - iso_misses
+        self._log(["Isomorphism cache hits", file_iso_hits, file_iso_queries])
+        self._log(["Total run time", total_time_now - start_time])
+
+        # 9) Finish the per-file results
+        with profiler.stage('save_results'):
+            self.result_sink.close()
+        self.result_sink = NullSink()
+
+        if self.profile:
+            profiler.dump(
+                os.path.join(self.result_path, f'{self.qasm_filename}_rb{self.interaction_radius:.3g}_profile.json'),
+                file=self.qasm_filename,
+                num_qubits=num_qubits,
+                num_cz_gates=num_cz_gates,
+                total_seconds=time.time() - start_time
+            )
 
         # 10) Return the row of aggregated stats for the main (benchmark-wide) workbook
         return [
             self.qasm_filename,
             num_qubits,
             num_cz_gates,
-            qc_object.depth(),
+            circuit_depth,
             fidelity,
             move_fidelity,
-            len(movements_list),
+            fidelity_model.num_stages,
             num_moves * 4,           # num of transfer
             num_moves,
             total_move_distance,
-            len(merged_parallel_gates),
+            num_gate_cycles,
             len(embeddings),
             (total_time_now - start_time),
             total_runtime,
@@ -177,154 +265,244 @@ class SingleFileProcessor:
         num_qubits = get_qubits_num(two_qubit_gates_list)
         grid_size = math.ceil(math.sqrt(num_qubits))
 
-        self.file_process_log.append(["Number of CZ gates", num_cz_gates])
-        self.file_process_log.append(["Initial grid size (sqrt(num_qubits))", grid_size])
-        self.file_process_log.append(["Interaction radius (Rb)", self.interaction_radius])
-        self.file_process_log.append(["Extended radius (Re)", self.extended_radius])
+        self._log(["Number of CZ gates", num_cz_gates])
+        self._log(["Initial grid size (sqrt(num_qubits))", grid_size])
+        self._log(["Interaction radius (Rb)", self.interaction_radius])
+        self._log(["Extended radius (Re)", self.extended_radius])
 
         return num_qubits, num_cz_gates, grid_size
 
-    def _generate_coupling_graph(self, grid_size):
+    def _generate_architecture(self, grid_size):
         """
-        Create a 2D grid-based coupling graph based on the specified grid size
-        and the interaction radius.
+        Create a 2D grid-based architecture based on the specified grid size
+        and the interaction radius. It is built once and shared by every
+        partitioning and embedding query of this file.
 
         :param grid_size: The number of rows/columns in the square grid.
-        :return: A graph representing qubit coupling.
+        :return: An Architecture holding the qubit coupling graph.
         """
-        return generate_grid_with_Rb(grid_size, grid_size, self.interaction_radius)
+        return Architecture(grid_size, self.interaction_radius)
 
-    def _retrieve_or_generate_partitions(self, filename, coupling_graph, dag_object):
+    def _retrieve_or_generate_partitions(self, architecture, gate_layer_list, gates_digest=None, store=None):
         """
-        Retrieve precomputed partitions from JSON if read_embeddings is True,
-        otherwise partition the circuit's DAG and optionally save to JSON.
-
-        :param filename: Name of the QASM file (without path).
-        :param coupling_graph: Graph of qubit couplings.
-        :param dag_object: DAG representation of the circuit.
+        Retrieve precomputed partitions from the embedding store if one is given (read_embeddings),
+        use the partitions handed to the processor, or take them from the compile cache when
+        it holds an entry for this circuit and setting. Otherwise partition the circuit's gate layers.
+
+        :param architecture: Architecture holding the qubit coupling graph.
+        :param gate_layer_list: ASAP layers of the circuit's 2-qubit gates.
+        :param gates_digest: gate_list_digest of the circuit.
+        :param store: The loaded EmbeddingStore of this file, or None.
         :return: A list of partitioned gates.
         """
-        if self.read_embeddings:
-            return read_data(
-                self.partitions_path,
-                filename.removesuffix(".qasm") + '.json'
+        if store is not None:
+            return store.partition_gates()
+        if self.partitions is not None:
+            return self.partitions
+
+        cache_key = None
+        if self.compile_cache is not None:
+            cache_key = CompileCache.key(
+                'partitions', gates_digest, Rb=self.interaction_radius, grid_size=architecture.arch_size
             )
-        else:
-            start_partition_time = time.time()
-            partitioned_gates = partition_from_DAG(dag_object, coupling_graph)
-            self.file_process_log.append(["Partitioning time", time.time() - start_partition_time])
-
-            if self.save_partitions_and_embeddings:
-                write_data_json(
-                    partitioned_gates,
-                    self.partitions_path,
-                    filename.removesuffix(".qasm") + 'part.json'
-                )
-            return partitioned_gates
+            partitioned_gates = self.compile_cache.get(cache_key)
+            self._log(["Partition cache", "hit" if partitioned_gates is not None else "miss"])
+            if partitioned_gates is not None:
+                return partitioned_gates
+
+        start_partition_time = time.time()
+        partitioned_gates = partition_from_layers(gate_layer_list, architecture)
+        self._log(["Partitioning time", time.time() - start_partition_time])
+
+        if cache_key is not None:
+            self.compile_cache.put(cache_key, partitioned_gates)
+        return partitioned_gates
+
+    def _embedding_store_path(self, filename):
+        return os.path.join(self.embeddings_path, filename.removesuffix(".qasm") + '.dasemb')
+
+    def _load_embedding_store(self, filename, gates_digest):
+        """
+        Memory-map the saved embedding store of this file and check that it belongs
+        to the same circuit and interaction radius.
+
+        :param filename: QASM file name (string).
+        :param gates_digest: gate_list_digest of the circuit.
+        :return: The EmbeddingStore.
+        """
+        store = load_embedding_store(self._embedding_store_path(filename))
+        if store.circuit_hash != gates_digest or store.Rb != self.interaction_radius:
+            raise ValueError(
+                f"Stored embeddings of {filename} were computed for another circuit or Rb; "
+                f"rerun without --read_embeddings"
+            )
+        return store
 
     def _retrieve_or_generate_embeddings(
         self,
         filename,
         partitioned_gates,
-        coupling_graph,
+        architecture,
         num_qubits,
-        grid_size
+        grid_size,
+        gates_digest=None,
+        store=None
     ):
         """
-        Retrieve or compute embeddings for each partition. If read_embeddings
-        is True, read from JSON. Otherwise, compute embeddings and optionally save.
+        Retrieve or compute embeddings for each partition. If an embedding store
+        is given (read_embeddings), use its memory-mapped embeddings; a compile-cache
+        entry for this circuit and setting is used next. Otherwise, compute
+        embeddings. New results are optionally saved to the embedding store.
 
         :param filename: QASM file name (string).
-        :param partitioned_gates: A list of partitioned gates (from partition_from_DAG).
-        :param coupling_graph: Qubit coupling graph.
+        :param partitioned_gates: A list of partitioned gates (from partition_from_layers).
+        :param architecture: Architecture holding the qubit coupling graph.
         :param num_qubits: Number of qubits in the circuit.
         :param grid_size: Current grid dimension.
-        :return: (embeddings, potentially updated grid_size)
+        :param gates_digest: gate_list_digest of the circuit.
+        :param store: The loaded EmbeddingStore of this file, or None.
+        :return: (embeddings, the final grid_size the embeddings live on)
         """
-        if self.read_embeddings:
-            embeddings = read_data(
-                self.embeddings_path,
-                filename.removesuffix(".qasm") + '.json'
+        if store is not None:
+            # Stored embeddings may come from a grown grid
+            while architecture.arch_size < store.grid_size:
+                extend_graph(architecture)
+            # Embeddings are views into the memory-mapped store
+            return [Embedding(coords) for coords in store.embeddings], architecture.arch_size
+
+        cache_key = cached = None
+        if self.compile_cache is not None:
+            cache_key = CompileCache.key(
+                'embeddings', gates_digest, Rb=self.interaction_radius, grid_size=architecture.arch_size,
+                **self.embedding_options
             )
-            return embeddings, grid_size
-        else:
+            cached = self.compile_cache.get(cache_key)
+            self._log(["Embedding cache", "hit" if cached is not None else "miss"])
+            if cached is not None:
+                # Grow the architecture to the grid the embeddings were found on
+                while architecture.arch_size < cached['grid_size']:
+                    extend_graph(architecture)
+                embeddings = [Embedding(embedding) for embedding in cached['embeddings']]
+                extended_positions = cached['extended_positions']
+
+        if cached is None:
             start_embed_time = time.time()
             embeddings, extended_positions = get_embeddings(
                 partitioned_gates,
-                coupling_graph,
+                architecture,
                 num_qubits,
-                grid_size,
-                self.interaction_radius
+                **self.embedding_options
+            )
+            self._log(["Embedding computation time", time.time() - start_embed_time])
+
+            if cache_key is not None:
+                self.compile_cache.put(cache_key, {
+                    'embeddings': [embedding.tolist() for embedding in embeddings],
+                    'extended_positions': extended_positions,
+                    'grid_size': architecture.arch_size
+                })
+
+        if self.save_partitions_and_embeddings:
+            write_embedding_store(
+                self._embedding_store_path(filename),
+                embeddings,
+                partitioned_gates,
+                self.interaction_radius,
+                architecture.arch_size,
+                gates_digest
             )
-            self.file_process_log.append(["Embedding computation time", time.time() - start_embed_time])
-
-            if self.save_partitions_and_embeddings:
-                write_data_json(
-                    embeddings,
-                    self.embeddings_path,
-                    filename.removesuffix(".qasm") + 'emb.json'
-                )
 
-            # If graph was extended, reflect this in the grid_size
-            if extended_positions:
-                self.file_process_log.append(["Graph extension count", len(extended_positions)])
-                self.file_process_log.append(["Extended positions", extended_positions])
-                grid_size += len(extended_positions)
+        # If graph was extended, the architecture has grown in place
+        if extended_positions:
+            self._log(["Graph extension count", len(extended_positions)])
+            self._log(["Extended positions", str(extended_positions)])
 
-            return embeddings, grid_size
+        return embeddings, architecture.arch_size
 
-    def _compute_gates_and_movements(self, num_qubits, partitioned_gates, embeddings, coupling_graph, grid_size):
+    def _compute_gates_and_movements(self, num_qubits, partitioned_gates, embeddings, coupling_graph, grid_size, fidelity_model=None):
         """
         Use the QuantumRouter to determine how to move qubits between partitions.
         Also compute the parallel gates for each partition based on the extended radius.
+        Gate cycles and move stages are written out as they are produced and not kept.
 
         :param num_qubits: Number of qubits in the circuit.
         :param partitioned_gates: Gates partitioned by circuit stage.
         :param embeddings: Embeddings for each partition.
         :param coupling_graph: Grid-based qubit coupling graph.
         :param grid_size: Dimensions of the square grid.
-        :return: (list of parallel gate groups, list of all movement operations, merged list of parallel gates)
+        :param fidelity_model: FidelityAccumulator fed with every gate cycle and move stage (optional).
+        :return: Number of parallel gate cycles.
         """
-        parallel_gate_groups = []
-        movement_operations = []
-        merged_parallel_gates = []
+        num_gate_cycles = 0
 
-        # QuantumRouter: figure out the qubit re-locations from partition N to N+1
+        # QuantumRouter: figure out the qubit re-locations from partition N to N+1.
+        # Transitions are streamed and written out as soon as they are routed.
         router = QuantumRouter(
-            num_qubits, embeddings, partitioned_gates, [grid_size, grid_size]
+            num_qubits, embeddings, partitioned_gates, [grid_size, grid_size],
+            workers=self.routing_workers
         )
-        router.run()
-
-        # Generate the parallel gates for each partition
-        for i in range(len(partitioned_gates)):
-            gates = get_parallel_gates(
-                partitioned_gates[i],
-                coupling_graph,
-                embeddings[i],
-                self.extended_radius
-            )
-            parallel_gate_groups.append(gates)
-
-        # Append parallel gates and movement sequences
-        for i in range(len(embeddings) - 1):
-            # Log parallel gate group for partition i
-            for g_list in parallel_gate_groups[i]:
-                self.file_process_log.append([str(g) for g in g_list])
-                merged_parallel_gates.append(g_list)
+        transitions = router.iter_movements()
+        schedule_writer = MoveScheduleWriter(
+            os.path.join(self.result_path, f'{self.qasm_filename}_rb{self.interaction_radius:.3g}.moves')
+        ) if self.save_schedule else None
 
-            # Movement from partition i to partition i+1
-            for move_group in router.movement_list[i]:
-                self.file_process_log.append([str(m) for m in move_group])
-                movement_operations.append(move_group)
-
-        # The last partition (which doesn't need to move to a next partition)
-        if len(partitioned_gates) > 0:
-            self.file_process_log.append([str(embeddings[-1])])
-            for g_list in parallel_gate_groups[-1]:
-                self.file_process_log.append([str(g) for g in g_list])
-                merged_parallel_gates.append(g_list)
+        try:
+            for i in range(len(partitioned_gates)):
+                # Generate the parallel gates for partition i
+                with profiler.stage('gate_packing'):
+                    gates = get_parallel_gates(
+                        partitioned_gates[i],
+                        coupling_graph,
+                        embeddings[i],
+                        self.extended_radius
+                    )
+                num_gate_cycles += len(gates)
+                profiler.count('packing.gate_cycles', len(gates))
+                if fidelity_model is not None:
+                    fidelity_model.add_gate_cycles(gates)
+
+                if i == len(partitioned_gates) - 1:
+                    # The last partition (which doesn't need to move to a next partition)
+                    self.result_sink.write_row([str(embeddings[-1])])
+
+                # Log parallel gate group for partition i
+                for g_list in gates:
+                    self.result_sink.write_row([str(g) for g in g_list])
+
+                if i == len(partitioned_gates) - 1:
+                    break
+
+                # Movement from partition i to partition i+1
+                with profiler.stage('routing'):
+                    stages = next(transitions)
+                profiler.count('routing.transitions')
+                profiler.count('routing.mis_rounds', len(stages))
+                profiler.count('routing.moves', sum(len(stage) for stage in stages))
+                if schedule_writer is not None:
+                    schedule_writer.write_transition(stages)
+                if fidelity_model is not None:
+                    fidelity_model.add_move_stages(stages)
+                for move_group in stages:
+                    self.result_sink.write_row([str(m) for m in move_group])
+        finally:
+            transitions.close()
+            if schedule_writer is not None:
+                schedule_writer.close()
+
+        return num_gate_cycles
+
+
+def _process_single_file(qasm_file, processor_settings):
+    """
+    Worker entry point of DasAtom.process_all_files when running with several jobs.
 
-        return parallel_gate_groups, movement_operations, merged_parallel_gates
+    :param qasm_file: Name of the QASM file to process.
+    :param processor_settings: Keyword arguments of SingleFileProcessor besides the filename.
+    :return: (summary row, isomorphism cache hits, isomorphism cache queries) of this file.
+    """
+    hits, queries = iso_cache.hits, iso_cache.hits + iso_cache.misses
+    row_data = SingleFileProcessor(qasm_filename=qasm_file, **processor_settings).process_qasm_file()
+    return row_data, iso_cache.hits - hits, iso_cache.hits + iso_cache.misses - queries
 
 
 class DasAtom:
@@ -345,7 +523,16 @@ class DasAtom:
         read_embeddings: bool = False,
         save_partitions_and_embeddings: bool = True,
         save_circuit_results: bool = True,
-        save_benchmark_results: bool = True
+        save_benchmark_results: bool = True,
+        routing_workers: int = 1,
+        jobs: int = 1,
+        profile: bool = False,
+        use_cache: bool = True,
+        cache_dir: str = None,
+        cache_max_mb: float = 1024,
+        result_format: str = "xlsx",
+        save_schedule: bool = False,
+        embedding_options: dict = None
     ):
         """
         Initialize the multi-file processor with user-provided settings.
@@ -355,9 +542,18 @@ class DasAtom:
         :param interaction_radius: The interaction radius (Rb).
         :param results_folder: The parent folder where results are stored (defaults to 'res/{benchmark_name}').
         :param read_embeddings: If True, read existing embeddings/partitions from disk.
-        :param save_partitions_and_embeddings: If True, save newly computed partitions/embeddings to JSON.
+        :param save_partitions_and_embeddings: If True, save newly computed partitions/embeddings to the binary embedding store.
         :param save_circuit_results: If True, save per-circuit XLSX logs.
         :param save_benchmark_results: If True, save a master XLSX for all circuits.
+        :param routing_workers: Number of worker processes used to route the partition transitions of a circuit.
+        :param jobs: Number of circuits processed in parallel worker processes (1 = sequential).
+        :param profile: If True, write a JSON profile of the pipeline stages for every circuit.
+        :param use_cache: If True, reuse partitions/embeddings from the content-addressed compile cache.
+        :param cache_dir: Folder of the compile cache (defaults to 'cache' inside the Rb results folder).
+        :param cache_max_mb: Size limit of the compile cache in MiB.
+        :param result_format: Format of the per-circuit results: "xlsx", "csv" or "jsonl".
+        :param save_schedule: If True, write each circuit's move schedule to a binary '.moves' file.
+        :param embedding_options: Hyper-parameters passed to get_embeddings (defaults when None).
         """
         self.benchmark_name = benchmark_name
         self.interaction_radius = interaction_radius
@@ -385,6 +581,15 @@ class DasAtom:
         self.save_partitions_and_embeddings = save_partitions_and_embeddings
         self.save_circuit_results = save_circuit_results
         self.save_benchmark_results = save_benchmark_results
+        self.routing_workers = routing_workers
+        self.jobs = max(1, jobs)
+        self.profile = profile
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_max_mb = cache_max_mb
+        self.result_format = result_format
+        self.save_schedule = save_schedule
+        self.embedding_options = resolve_embedding_options(**(embedding_options or {}))
 
     @staticmethod
     def _extract_numeric_suffix(filename: str):
@@ -408,6 +613,40 @@ class DasAtom:
         except Exception:
             return float('inf')
 
+    def _process_files_in_parallel(self, qasm_files, processor_settings):
+        """
+        Process the QASM files on `self.jobs` worker processes. The largest files are
+        submitted first so that the biggest circuits do not set the tail latency. Rows
+        are written to the master sheet by this process only, in the original file
+        order, as soon as all preceding files are done.
+
+        :param qasm_files: Filenames to process, in the order of the summary rows.
+        :param processor_settings: Keyword arguments shared by every SingleFileProcessor.
+        :return: (isomorphism cache hits, isomorphism cache queries) summed over the workers.
+        """
+        schedule = sorted(
+            range(len(qasm_files)),
+            key=lambda i: os.path.getsize(os.path.join(self.circuit_folder, qasm_files[i])),
+            reverse=True
+        )
+        finished_rows = {}
+        next_row = 0
+        cache_hits = cache_queries = 0
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(qasm_files))) as pool:
+            futures = {}
+            for i in schedule:
+                print(f"Processing: {qasm_files[i]}")
+                futures[pool.submit(_process_single_file, qasm_files[i], processor_settings)] = i
+            for future in as_completed(futures):
+                row_data, hits, queries = future.result()
+                cache_hits += hits
+                cache_queries += queries
+                finished_rows[futures[future]] = row_data
+                while next_row in finished_rows:
+                    self.master_sheet.append(finished_rows.pop(next_row))
+                    next_row += 1
+        return cache_hits, cache_queries
+
     def modify_result_folder(self, new_folder: str):
         """
         Change the results folder if the given path does not already exist.
@@ -432,58 +671,50 @@ class DasAtom:
         # Prepare sub-folders
         result_subfolder = os.path.join(self.results_folder, f"Rb{self.interaction_radius:.3g}Re{self.extended_radius:.3g}")
         embeddings_subfolder = os.path.join(result_subfolder, "embeddings")
-        partitions_subfolder = os.path.join(result_subfolder, "partitions")
         os.makedirs(embeddings_subfolder, exist_ok=True)
-        os.makedirs(partitions_subfolder, exist_ok=True)
 
         # Create a master Excel workbook for the entire benchmark
         self.master_workbook = Workbook()
         self.master_sheet = self.master_workbook.active
-        self.master_sheet.append([
-            'QASM File',
-            'Num Qubits',
-            'Num CZ Gates',
-            'Circuit Depth',
-            'Fidelity',
-            'Movement Fidelity',
-            'Num Movement Ops',
-            'Num Transferred Qubits',
-            'Num Moves',
-            'Total Move Distance',
-            'Num Gate Cycles',
-            'Num Partitions',
-            'Elapsed Time (s)',
-            'Total_T (from fidelity calc)',
-            'Idle Time'
-        ])
+        self.master_sheet.append(SUMMARY_HEADER)
 
         # If no indices specified, process all files
         if file_indices is None:
             file_indices = range(len(self.qasm_files))
 
         # Process each specified file
-        for idx in file_indices:
-            qasm_file = self.qasm_files[idx]
-            print(f"Processing: {qasm_file}")
-
-            processor = SingleFileProcessor(
-                qasm_filename=qasm_file,
-                circuit_folder=self.circuit_folder,
-                benchmark_name=self.benchmark_name,
-                interaction_radius=self.interaction_radius,
-                extended_radius=self.extended_radius,
-                result_path=result_subfolder,
-                embeddings_path=embeddings_subfolder,
-                partitions_path=partitions_subfolder,
-                read_embeddings=self.read_embeddings,
-                save_partitions_and_embeddings=self.save_partitions_and_embeddings,
-                save_circuit_results=self.save_circuit_results,
-                save_benchmark_results=self.save_benchmark_results
-            )
+        processor_settings = dict(
+            circuit_folder=self.circuit_folder,
+            benchmark_name=self.benchmark_name,
+            interaction_radius=self.interaction_radius,
+            extended_radius=self.extended_radius,
+            result_path=result_subfolder,
+            embeddings_path=embeddings_subfolder,
+            read_embeddings=self.read_embeddings,
+            save_partitions_and_embeddings=self.save_partitions_and_embeddings,
+            save_circuit_results=self.save_circuit_results,
+            save_benchmark_results=self.save_benchmark_results,
+            routing_workers=self.routing_workers,
+            profile=self.profile,
+            cache_dir=(self.cache_dir or os.path.join(result_subfolder, "cache")) if self.use_cache else None,
+            cache_max_mb=self.cache_max_mb,
+            result_format=self.result_format,
+            save_schedule=self.save_schedule,
+            embedding_options=self.embedding_options
+        )
+        qasm_files = [self.qasm_files[idx] for idx in file_indices]
+        if self.jobs > 1 and len(qasm_files) > 1:
+            cache_hits, cache_queries = self._process_files_in_parallel(qasm_files, processor_settings)
+        else:
+            for qasm_file in qasm_files:
+                print(f"Processing: {qasm_file}")
+                # Returns one row of aggregated stats
+                row_data = SingleFileProcessor(qasm_filename=qasm_file, **processor_settings).process_qasm_file()
+                self.master_sheet.append(row_data)
+            cache_hits, cache_queries = iso_cache.hits, iso_cache.hits + iso_cache.misses
 
-            # Returns one row of aggregated stats
-            row_data = processor.process_qasm_file()
-            self.master_sheet.append(row_data)
+        print(f"Isomorphism cache: {cache_hits} hits / {cache_queries} queries "
+              f"(hit rate {cache_hits / cache_queries if cache_queries else 0.0:.1%})")
 
         # Optionally append global parameters at the bottom
         params_dict = set_parameters(True)
@@ -511,12 +742,25 @@ if __name__ == "__main__":
     parser.add_argument("--results_folder", type=str, help="Folder where results are stored (default: res/{benchmark_name}).")
     parser.add_argument("--read_embeddings", action="store_true", default=False, help="Read precomputed embeddings/partitions.")
     parser.add_argument("--padused", type=bool, default=False, help="Whether to use a specialized embedding tool (not used in code).")
-    parser.add_argument("--save_embeddings", action="store_true", default=True, help="Save partition/embedding JSONs (default=True).")
+    parser.add_argument("--save_embeddings", action="store_true", default=True, help="Save partitions/embeddings to the binary embedding store (default=True).")
     parser.add_argument("--no_save_embeddings", action="store_false", dest="save_embeddings", help="Do not save partitions/embeddings.")
-    parser.add_argument("--save_circuit_results", action="store_true", default=True, help="Save circuit-level XLSX logs (default=True).")
+    parser.add_argument("--save_circuit_results", action="store_true", default=True, help="Save circuit-level logs (default=True).")
+    parser.add_argument("--result_format", type=str, choices=["xlsx", "csv", "jsonl"], default="xlsx", help="Format of the circuit-level logs (default=xlsx).")
+    parser.add_argument("--save_schedule", action="store_true", default=False, help="Write the move schedule of every circuit to a binary .moves file.")
     parser.add_argument("--no_save_circuit_results", action="store_false", dest="save_circuit_results", help="Do not save circuit-level logs.")
     parser.add_argument("--save_benchmark_results", action="store_true", default=True, help="Save summary XLSX at benchmark-level (default=True).")
     parser.add_argument("--no_save_benchmark_results", action="store_false", dest="save_benchmark_results", help="Do not save summary XLSX.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of circuits processed in parallel worker processes (default=1).")
+    parser.add_argument("--no_cache", action="store_false", dest="use_cache", help="Do not use the partition/embedding compile cache.")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Compile cache folder (default: <results>/Rb*Re*/cache).")
+    parser.add_argument("--cache_max_mb", type=float, default=1024, help="Size limit of the compile cache in MiB (default=1024).")
+    parser.add_argument("--profile", action="store_true", default=False, help="Write per-circuit JSON stage profiles.")
+    parser.add_argument("--max_candidates", type=int, default=50, help="Number of VF2 embedding candidates scored per partition (default=50).")
+    parser.add_argument("--idle_weight", type=float, default=0.3, help="Weight of idle qubits in the movement cost of a candidate embedding (default=0.3).")
+    parser.add_argument("--search_strategy", type=str, choices=["vf2", "bnb"], default="vf2", help="Embedding search strategy (default=vf2).")
+    parser.add_argument("--expansion_budget", type=int, default=5000, help="Node expansion budget of the 'bnb' search strategy (default=5000).")
+    parser.add_argument("--no_optimize_movement", action="store_false", dest="optimize_movement", help="Take the first embedding found instead of the one closest to the previous partition.")
+    parser.add_argument("--routing_workers", type=int, default=1, help="Worker processes used to route partition transitions (default=1).")
 
     args = parser.parse_args()
 
@@ -528,6 +772,21 @@ if __name__ == "__main__":
         read_embeddings=args.read_embeddings,
         save_partitions_and_embeddings=args.save_embeddings,
         save_circuit_results=args.save_circuit_results,
-        save_benchmark_results=args.save_benchmark_results
+        save_benchmark_results=args.save_benchmark_results,
+        routing_workers=args.routing_workers,
+        jobs=args.jobs,
+        profile=args.profile,
+        use_cache=args.use_cache,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_max_mb,
+        result_format=args.result_format,
+        save_schedule=args.save_schedule,
+        embedding_options=dict(
+            optimize_movement=args.optimize_movement,
+            max_candidates=args.max_candidates,
+            idle_weight=args.idle_weight,
+            search_strategy=args.search_strategy,
+            expansion_budget=args.expansion_budget
+        )
     )
     das_atom.process_all_files()
\ No newline at end of file
@@ -1,64 +1,139 @@
 import rustworkx as rx
 import networkx as nx
 import numpy as np
-import random
 import math
 import os
 import re
+import csv
 import json
-
+import time
+import hashlib
+import numbers
+import inspect
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import islice
+
+from scipy.optimize import linear_sum_assignment
 from qiskit import qasm2, transpile, QuantumCircuit, QuantumRegister
 from qiskit.converters import dag_to_circuit, circuit_to_dag
 from qiskit.circuit import library
 import copy
-from copy import deepcopy
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 custom = [
     qasm2.CustomInstruction("p",num_params= 1, num_qubits=1 ,constructor=library.PhaseGate, builtin=True),
 ]
 
+ALLOWED_BASIS_GATES = {'cz', 'h', 's', 't', 'rx', 'ry', 'rz'}
+
 def CreateCircuitFromQASM(file, path):
     filePath = os.path.join(path,file)
     # print(filePath)
     cir = qasm2.load(filePath, custom_instructions=custom)
     gates_in_circuit = {op[0].name for op in cir.data}
-    allowed_basis_gates = {'cz', 'h', 's', 't', 'rx', 'ry', 'rz'}
     # Check if there are any disallowed gates by checking the difference between sets
-    if gates_in_circuit - allowed_basis_gates:
-        cir = transpile(cir, basis_gates=list(allowed_basis_gates),optimization_level=0)
+    if gates_in_circuit - ALLOWED_BASIS_GATES:
+        cir = transpile(cir, basis_gates=list(ALLOWED_BASIS_GATES),optimization_level=0)
     return cir
 
 
-def get_rx_one_mapping(graph_max, G):
-    sub_graph = rx.networkx_converter(graph_max)
-    big_graph = rx.networkx_converter(G)
-    nx_edge_s = list(graph_max.edges())
-    rx_edge_s = list(sub_graph.edge_list())
-    rx_nx_s = dict()
-    for i in range(len(rx_edge_s)):
-        if rx_edge_s[i][0] not in rx_nx_s:
-            rx_nx_s[rx_edge_s[i][0]] = nx_edge_s[i][0]
-        if rx_edge_s[i][1] not in rx_nx_s:
-            rx_nx_s[rx_edge_s[i][1]] = nx_edge_s[i][1]
-    nx_edge_G = list(G.edges())
-    rx_edge_G = list(big_graph.edge_list())
-    rx_nx_G = dict()
-    for i in range(len(rx_edge_G)):
-        if rx_edge_G[i][0] not in rx_nx_G:
-            rx_nx_G[rx_edge_G[i][0]] = nx_edge_G[i][0]
-        if rx_edge_G[i][1] not in rx_nx_G:
-            rx_nx_G[rx_edge_G[i][1]] = nx_edge_G[i][1]
-    vf2 = rx.vf2_mapping(big_graph, sub_graph, subgraph=True, induced = False)
-    item = next(vf2)
-    reverse_mapping = {rx_nx_s[value]: rx_nx_G[key] for  key, value in item.items()}
-    return reverse_mapping
-
-
-def get_best_mapping_with_inertia(graph_max, G, num_q, 
+class UnsupportedQASMError(ValueError):
+    """
+    Raised by ``stream_2q_gates`` when a QASM file needs the full qiskit parser/transpiler.
+    """
+
+
+_qasm_gate_pattern = re.compile(r"^([A-Za-z_]\w*)\s*(?:\([^)]*\))?\s*(.*)$", re.DOTALL)
+_qasm_qubit_pattern = re.compile(r"^([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\]$")
+_qasm_skipped_statements = ('OPENQASM', 'include', 'creg')
+
+def stream_2q_gates(filePath):
+    """
+    Stream the 2-qubit gates of a QASM 2 file line by line, without building qiskit objects.
+
+    Only files whose gates are all in ALLOWED_BASIS_GATES are accepted, i.e.
+    exactly the files that ``CreateCircuitFromQASM`` would not transpile.
+
+    Parameters:
+    filePath (str): Path to the QASM file.
+
+    Yields:
+    tuple[int, int]: Qubit indices of each 2-qubit gate, in program order. Like
+    ``Qubit._index`` in ``get_2q_gates_list``, an index is local to its register.
+
+    Raises:
+    UnsupportedQASMError: On any statement outside the allowed basis (custom gates,
+    measurements, barriers, classical control, register broadcasting, ...).
+    """
+    qregs = {}
+    pending = ''
+    with open(filePath, 'r') as file:
+        for line in file:
+            comment = line.find('//')
+            if comment != -1:
+                line = line[:comment]
+            pending += line
+            if ';' not in pending:
+                continue
+            *statements, pending = pending.split(';')
+            for statement in statements:
+                statement = statement.strip()
+                if not statement or statement.startswith(_qasm_skipped_statements):
+                    continue
+                match = _qasm_gate_pattern.match(statement)
+                if match is None:
+                    raise UnsupportedQASMError(f"Cannot stream statement: {statement}")
+                name, operands = match.group(1), match.group(2)
+                if name == 'qreg':
+                    register = _qasm_qubit_pattern.match(operands.strip())
+                    if register is None:
+                        raise UnsupportedQASMError(f"Cannot stream statement: {statement}")
+                    qregs[register.group(1)] = int(register.group(2))
+                    continue
+                if name not in ALLOWED_BASIS_GATES:
+                    raise UnsupportedQASMError(f"Gate '{name}' is not in the allowed basis")
+                qubits = []
+                for operand in operands.split(','):
+                    qubit = _qasm_qubit_pattern.match(operand.strip())
+                    if qubit is None or int(qubit.group(2)) >= qregs.get(qubit.group(1), 0):
+                        raise UnsupportedQASMError(f"Cannot stream statement: {statement}")
+                    qubits.append(int(qubit.group(2)))
+                if len(qubits) == 2:
+                    yield qubits[0], qubits[1]
+    if pending.strip():
+        raise UnsupportedQASMError(f"Unterminated statement: {pending.strip()}")
+
+def load_2q_gates_list(file, path):
+    """
+    Get the 2-qubit gate list of a QASM file, streaming it when it is already
+    basis-compliant and falling back to qiskit (parse + transpile) otherwise.
+
+    Parameters:
+    file (str): Name of the QASM file.
+    path (str): Directory containing the file.
+
+    Returns:
+    list[tuple[int, int]]: The 2-qubit gates, same as ``get_2q_gates_list(CreateCircuitFromQASM(file, path))``.
+    """
+    try:
+        return list(stream_2q_gates(os.path.join(path, file)))
+    except UnsupportedQASMError:
+        return get_2q_gates_list(CreateCircuitFromQASM(file, path))
+
+
+def get_best_mapping_with_inertia(graph_max, architecture, num_q, 
                                   prev_embedding=None,
                                   current_gates=None,
                                   max_candidates=50,
-                                  idle_weight=0.3):
+                                  idle_weight=0.3,
+                                  batch_size=256):
     """
     基于惯性启发式的改进 VF2 映射选择器
     
@@ -67,44 +142,31 @@ def get_best_mapping_with_inertia(graph_max, G, num_q,
     
     参数:
         graph_max: 逻辑连接图（NetworkX Graph）
-        G: 硬件拓扑图（NetworkX Graph）
+        architecture: 硬件架构（Architecture，复用其 RustworkX 图）
         num_q: 量子比特总数
-        prev_embedding: 上一个分区的嵌入映射（列表格式）
+        prev_embedding: 上一个分区的嵌入映射（Embedding，未放置的比特为 -1）
         current_gates: 当前分区的门列表 [[q0,q1], ...]
         max_candidates: 最多评估的 VF2 候选解数量
         idle_weight: 闲置量子比特的移动成本权重 (0.0-1.0)
                     0.0 = 只考虑参与门的量子比特（激进）
                     1.0 = 所有量子比特同等重要（保守）
                     0.3 = 推荐值（平衡）
+        batch_size: 每批向量化评估的候选解数量上限（批大小从 1 开始倍增）
     
     返回:
         reverse_mapping: 字典格式的映射 {logical_qubit: physical_position}
     """
-    # 1. 图结构转换 (NetworkX -> RustworkX)
+    # 1. 逻辑图转换 (NetworkX -> RustworkX)，硬件图直接复用 architecture 中的句柄
     sub_graph = rx.networkx_converter(graph_max)
-    big_graph = rx.networkx_converter(G)
+    big_graph = architecture.rx_graph
     
-    # 2. 建立 RustworkX ID 与 NetworkX 节点的映射表
-    nx_edge_s = list(graph_max.edges())
-    rx_edge_s = list(sub_graph.edge_list())
-    rx_nx_s = dict()
-    for i in range(len(rx_edge_s)):
-        if rx_edge_s[i][0] not in rx_nx_s:
-            rx_nx_s[rx_edge_s[i][0]] = nx_edge_s[i][0]
-        if rx_edge_s[i][1] not in rx_nx_s:
-            rx_nx_s[rx_edge_s[i][1]] = nx_edge_s[i][1]
-    
-    nx_edge_G = list(G.edges())
-    rx_edge_G = list(big_graph.edge_list())
-    rx_nx_G = dict()
-    for i in range(len(rx_edge_G)):
-        if rx_edge_G[i][0] not in rx_nx_G:
-            rx_nx_G[rx_edge_G[i][0]] = nx_edge_G[i][0]
-        if rx_edge_G[i][1] not in rx_nx_G:
-            rx_nx_G[rx_edge_G[i][1]] = nx_edge_G[i][1]
+    # 2. RustworkX ID 与 NetworkX 节点的映射表
+    rx_nx_s = list(graph_max.nodes())
+    rx_nx_G = architecture.nodes
     
     # 3. 获取 VF2 迭代器
     vf2_iter = rx.vf2_mapping(big_graph, sub_graph, subgraph=True, induced=False)
+    profiler.count('embedding.vf2_calls')
     
     # 4. 如果没有前一个映射或门信息，使用原版逻辑
     if prev_embedding is None or current_gates is None:
@@ -122,54 +184,434 @@ def get_best_mapping_with_inertia(graph_max, G, num_q,
         active_qubits.add(gate[0])
         active_qubits.add(gate[1])
     
-    # 6. 遍历多个 VF2 解，选择移动成本最小的
-    best_mapping = None
-    min_move_cost = float('inf')
+    # 6. 预先计算每个逻辑比特（按子图节点顺序）的上一位置与权重
+    #    活跃量子比特权重1.0，闲置量子比特权重为idle_weight，上一映射中不存在的比特权重为0
+    num_sub = len(rx_nx_s)
+    prev_coords = np.asarray(Embedding(prev_embedding), dtype=np.int64)
+    logical = np.asarray(rx_nx_s, dtype=np.int64)
+    known = np.flatnonzero(logical < len(prev_coords))
+    known = known[prev_coords[logical[known], 0] >= 0]
+    prev_pos = np.zeros((num_sub, 2), dtype=np.int64)
+    prev_pos[known] = prev_coords[logical[known]]
+    weights = np.zeros(num_sub)
+    weights[known] = np.where(np.isin(logical[known], list(active_qubits)), 1.0, idle_weight)
     
-    for candidate_idx, item in enumerate(vf2_iter):
-        if candidate_idx >= max_candidates:
+    # 7. 分批取出 VF2 解，组成 (k, num_sub, 2) 坐标数组，一次广播计算加权移动成本
+    #    批大小从 1 开始倍增，找到零移动解时多枚举的 VF2 解不超过已评估的数量
+    best_sites = None
+    min_move_cost = float('inf')
+    candidates = islice(vf2_iter, max_candidates)
+    next_batch = 1
+    while True:
+        batch = list(islice(candidates, next_batch))
+        if not batch:
             break
+        next_batch = min(2 * next_batch, batch_size)
+        sites = np.empty((len(batch), num_sub), dtype=np.int64)
+        for row, item in enumerate(batch):
+            sites[row, list(item.values())] = list(item.keys())
+        delta = architecture.coords[sites] - prev_pos
+        dist = np.sqrt((delta * delta).sum(axis=2))
+        # cumsum 按子图节点顺序逐项累加，与逐个比特求和的浮点结果一致
+        move_cost = np.cumsum(weights * dist, axis=1)[:, -1]
         
-        # 转换当前候选解为 NetworkX 格式
-        candidate_mapping = {rx_nx_s[value]: rx_nx_G[key] 
-                           for key, value in item.items()}
-        
-        # 计算加权移动成本
-        move_cost = 0.0
-        
-        for logical_q, curr_pos in candidate_mapping.items():
-            # 只有当该量子比特在上一个映射中存在时才计算
-            if logical_q < len(prev_embedding) and prev_embedding[logical_q] != -1:
-                prev_pos = prev_embedding[logical_q]
-                
-                # 欧几里得距离
-                dist = math.sqrt(
-                    (curr_pos[0] - prev_pos[0])**2 + 
-                    (curr_pos[1] - prev_pos[1])**2
-                )
-                
-                # 加权策略：活跃量子比特权重1.0，闲置量子比特权重为idle_weight
-                weight = 1.0 if logical_q in active_qubits else idle_weight
-                move_cost += weight * dist
+        # 完美解：零移动（使用浮点数比较），只保留到批内第一个零移动候选
+        zero_rows = np.flatnonzero(move_cost < 1e-6)
+        if len(zero_rows):
+            move_cost = move_cost[:zero_rows[0] + 1]
+        profiler.count('embedding.candidates_scored', len(move_cost))
         
-        # 更新最优解
-        if move_cost < min_move_cost:
-            min_move_cost = move_cost
-            best_mapping = candidate_mapping
+        # 更新最优解（同成本时保留先出现的候选）
+        best_row = int(np.argmin(move_cost))
+        if move_cost[best_row] < min_move_cost:
+            min_move_cost = move_cost[best_row]
+            best_sites = sites[best_row]
         
-        # 完美解：零移动（使用浮点数比较）
-        if min_move_cost < 1e-6:
+        if len(zero_rows):
             break
     
-    # 如果找到优化解则返回，否则返回最后一个候选
-    return best_mapping if best_mapping is not None else candidate_mapping
+    # 只把最优候选转换回字典格式
+    if best_sites is None:
+        return None
+    return {rx_nx_s[sub_idx]: rx_nx_G[site] for sub_idx, site in enumerate(best_sites.tolist())}
 
-def rx_is_subgraph_iso(G, subG):
-    Grx = rx.networkx_converter(G)
+def branch_and_bound_embedding(graph_max, architecture, prev_embedding, current_gates,
+                               idle_weight=0.3, expansion_budget=5000):
+    """
+    Cost-guided branch-and-bound search for a low-movement embedding.
+
+    Logical qubits are placed one at a time, each next to its already-placed
+    neighbours. Candidate sites are tried in order of weighted distance from the
+    qubit's previous position, and a partial mapping is pruned as soon as its
+    weighted move cost reaches the best complete mapping found so far.
+
+    Parameters:
+    graph_max (nx.Graph): Logical interaction graph of the partition.
+    architecture (Architecture): Hardware architecture.
+    prev_embedding (Embedding): Embedding of the previous partition (-1 for unplaced qubits).
+    current_gates (list[list[int]]): Gates of the partition (their qubits get weight 1.0).
+    idle_weight (float): Weight of the move cost of idle qubits.
+    expansion_budget (int): Maximum number of search-node expansions.
+
+    Returns:
+    tuple[dict | None, bool]: The best mapping {logical_qubit: physical_position}
+    (None if none was found) and whether the search space was fully explored,
+    i.e. whether the result is optimal, or a proof that nothing fits when None.
+    """
+    logical = list(graph_max.nodes())
+    num_sub = len(logical)
+    sub_index = {q: k for k, q in enumerate(logical)}
+    sub_adj = [[sub_index[v] for v in graph_max.neighbors(q)] for q in logical]
+    site_adj = architecture.adjacency
+    site_degree = np.array([len(neigh) for neigh in site_adj])
+
+    # Place the most constrained qubit first, then always a neighbour of the placed ones
+    order = []
+    placed = [False] * num_sub
+    while len(order) < num_sub:
+        frontier = {v for k in order for v in sub_adj[k] if not placed[v]}
+        pool = frontier if frontier else [k for k in range(num_sub) if not placed[k]]
+        k = max(pool, key=lambda k: (sum(placed[v] for v in sub_adj[k]), len(sub_adj[k]), -k))
+        placed[k] = True
+        order.append(k)
+    parents = []
+    position = {k: pos for pos, k in enumerate(order)}
+    for pos, k in enumerate(order):
+        parents.append([v for v in sub_adj[k] if position[v] < pos])
+
+    # Weighted move cost of putting each logical qubit on each site
+    active_qubits = {q for gate in current_gates for q in gate}
+    cost_table = np.zeros((num_sub, len(architecture.nodes)))
+    # A qubit whose previous site is taken by another one must move at least one grid unit
+    unit_cost = [0.0] * num_sub
+    prev_owner = {}
+    prev_coords = np.asarray(Embedding(prev_embedding), dtype=np.int64)
+    for k, q in enumerate(logical):
+        if q < len(prev_coords) and prev_coords[q, 0] >= 0:
+            weight = 1.0 if q in active_qubits else idle_weight
+            delta = architecture.coords - prev_coords[q]
+            cost_table[k] = weight * np.sqrt((delta * delta).sum(axis=1))
+            unit_cost[k] = weight
+            prev_site = architecture.node_index.get(tuple(prev_coords[q].tolist()))
+            if prev_site is not None:
+                prev_owner[prev_site] = k
+    root_order = [np.argsort(cost_table[k], kind='stable').tolist() for k in range(num_sub)]
+    cost_rows = cost_table.tolist()
+    min_degree = [len(sub_adj[k]) for k in range(num_sub)]
+    feasible_site = [(site_degree >= min_degree[k]).tolist() for k in range(num_sub)]
+
+    assignment = [-1] * num_sub
+    blocked = [False] * num_sub
+    used = set()
+    best = {'cost': float('inf'), 'sites': None}
+    expansions = 0
+
+    def expand(depth, cost, bound):
+        nonlocal expansions
+        if depth == num_sub:
+            best['cost'], best['sites'] = cost, list(assignment)
+            return True
+        k = order[depth]
+        row = cost_rows[k]
+        if parents[depth]:
+            anchor = site_adj[assignment[parents[depth][0]]]
+            candidates = sorted((c for c in anchor if c not in used), key=row.__getitem__)
+        else:
+            candidates = (c for c in root_order[k] if c not in used)
+        if blocked[k]:
+            bound -= unit_cost[k]
+        for c in candidates:
+            new_cost = cost + row[c]
+            if new_cost + bound >= best['cost']:
+                break
+            if not feasible_site[k][c]:
+                continue
+            if any(c not in site_adj[assignment[v]] for v in parents[depth][1:]):
+                continue
+            owner = prev_owner.get(c)
+            blocks = owner is not None and owner != k and assignment[owner] == -1
+            new_bound = bound + unit_cost[owner] if blocks else bound
+            if new_cost + new_bound >= best['cost']:
+                continue
+            expansions += 1
+            if expansions > expansion_budget:
+                return False
+            assignment[k] = c
+            used.add(c)
+            if blocks:
+                blocked[owner] = True
+            finished = expand(depth + 1, new_cost, new_bound)
+            if blocks:
+                blocked[owner] = False
+            used.discard(c)
+            assignment[k] = -1
+            if not finished:
+                return False
+            if best['cost'] < 1e-6:
+                return True
+        return True
+
+    exhausted = expand(0, 0.0, 0.0)
+    profiler.count('embedding.bnb_searches')
+    profiler.count('embedding.bnb_expansions', min(expansions, expansion_budget))
+    if best['sites'] is None:
+        return None, exhausted
+    nodes = architecture.nodes
+    return {logical[k]: nodes[site] for k, site in enumerate(best['sites'])}, exhausted
+
+def search_embedding(graph_max, architecture, num_q, prev_embedding=None, current_gates=None,
+                     search_strategy="vf2", expansion_budget=5000, **kwargs):
+    """
+    Single embedding search that returns both the feasibility answer and the mapping.
+
+    Parameters:
+    graph_max (nx.Graph): Logical interaction graph of the partition.
+    architecture (Architecture): Hardware architecture.
+    num_q (int): Number of qubits.
+    prev_embedding (list): Embedding of the previous partition; when given with
+    current_gates, candidates are ranked with the inertia heuristic.
+    current_gates (list[list[int]]): Gates of the partition.
+    search_strategy (str): "vf2" ranks the first max_candidates VF2 solutions;
+    "bnb" runs ``branch_and_bound_embedding`` and falls back to VF2 only when its
+    budget runs out before any mapping is found.
+    expansion_budget (int): Node-expansion budget of the "bnb" strategy.
+    **kwargs: Passed to ``get_best_mapping_with_inertia`` (max_candidates, idle_weight, ...).
+
+    Returns:
+    dict | None: {logical_qubit: physical_position}, or None if the partition does not fit.
+    """
+    if search_strategy == "bnb" and prev_embedding is not None and current_gates is not None:
+        mapping, exhausted = branch_and_bound_embedding(graph_max, architecture, prev_embedding, current_gates,
+                                                        idle_weight=kwargs.get('idle_weight', 0.3),
+                                                        expansion_budget=expansion_budget)
+        if mapping is not None or exhausted:
+            return mapping
+    elif search_strategy not in ("vf2", "bnb"):
+        raise ValueError(f"Unknown search strategy: {search_strategy}")
+    if prev_embedding is not None and current_gates is not None:
+        try:
+            return get_best_mapping_with_inertia(graph_max, architecture, num_q,
+                                                 prev_embedding=prev_embedding,
+                                                 current_gates=current_gates,
+                                                 **kwargs)
+        except Exception as e:
+            print(f"⚠️  优化失败: {e}，回退到原版算法")
+    return get_best_mapping_with_inertia(graph_max, architecture, num_q)
+
+def rx_is_subgraph_iso(architecture, subG):
     subGrx = rx.networkx_converter(subG)
-    gm = rx.is_subgraph_isomorphic(Grx, subGrx, induced = False)   
+    gm = rx.is_subgraph_isomorphic(architecture.rx_graph, subGrx, induced = False)   
     return gm
 
+class SubgraphIsoCache:
+    """
+    LRU-bounded memo in front of ``rx_is_subgraph_iso``.
+
+    Entries are keyed by the architecture identity (grid size, Rb) and a
+    canonical signature of the logical graph: its Weisfeiler-Lehman hash plus
+    its sorted degree sequence. Graphs that share a signature are told apart
+    with an exact isomorphism test, so a hash collision never returns a wrong
+    answer.
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        """
+        Parameters:
+        maxsize (int): Maximum number of cached graphs before the least recently used are evicted.
+        """
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        Drop all cached entries and reset the hit/miss counters.
+        """
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate, 'size': self._size}
+
+    @staticmethod
+    def signature(subG) -> tuple:
+        degrees = tuple(sorted((d for _, d in subG.degree()), reverse=True))
+        return nx.weisfeiler_lehman_graph_hash(subG), degrees
+
+    def lookup(self, architecture, subG):
+        """
+        Look up a cached answer without running the isomorphism check.
+
+        Parameters:
+        architecture (Architecture): Hardware architecture.
+        subG (nx.Graph): Logical interaction graph.
+
+        Returns:
+        bool | None: The cached answer, or None on a miss.
+        """
+        key = (architecture.key, self.signature(subG))
+        bucket = self._entries.get(key)
+        if bucket is not None:
+            self._entries.move_to_end(key)
+            subGrx = rx.networkx_converter(subG)
+            for cached_graph, result in bucket:
+                if rx.is_isomorphic(cached_graph, subGrx):
+                    self.hits += 1
+                    return result
+        self.misses += 1
+        return None
+
+    def store(self, architecture, subG, result: bool) -> None:
+        """
+        Record whether subG embeds into the architecture.
+
+        Parameters:
+        architecture (Architecture): Hardware architecture.
+        subG (nx.Graph): Logical interaction graph.
+        result (bool): The isomorphism answer.
+        """
+        key = (architecture.key, self.signature(subG))
+        self._entries.setdefault(key, []).append((rx.networkx_converter(subG), result))
+        self._entries.move_to_end(key)
+        self._size += 1
+        while self._size > self.maxsize:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def is_subgraph_iso(self, architecture, subG) -> bool:
+        """
+        Return whether subG embeds into the architecture, answering from the cache when possible.
+
+        Parameters:
+        architecture (Architecture): Hardware architecture.
+        subG (nx.Graph): Logical interaction graph.
+
+        Returns:
+        bool: True if subG is (non-induced) subgraph isomorphic to the coupling graph.
+        """
+        result = self.lookup(architecture, subG)
+        if result is None:
+            result = rx_is_subgraph_iso(architecture, subG)
+            self.store(architecture, subG, result)
+        return result
+
+
+# Shared by all files processed in one run
+iso_cache = SubgraphIsoCache()
+
+def peak_rss_kb():
+    """
+    High-water mark of the resident set size of this process, in KiB (None where unsupported).
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def current_rss_kb():
+    """
+    Current resident set size of this process, in KiB (None where /proc is not available).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+class _StageTimer:
+    __slots__ = ('profiler', 'name', 'start', 'start_peak')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_peak = peak_rss_kb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        peak = peak_rss_kb()
+        self.profiler._record(self.name, elapsed, None if peak is None else peak - self.start_peak)
+        return False
+
+class StageProfiler:
+    """
+    Monotonic stage timers and event counters for the compile pipeline.
+
+    Disabled by default: ``stage`` then hands out one shared no-op context manager
+    and ``count`` returns immediately, so instrumented code pays a single attribute
+    check. For every stage the report holds the number of calls, the accumulated
+    wall time, by how much the stage raised the process peak RSS (0 when it stayed
+    below the peak reached before it, nested stages count in their parents too) and
+    the current RSS when the stage last finished. The report also holds the process
+    peak RSS and how much it grew since the last reset.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Drop all recorded timings and counters.
+        """
+        self.stages = {}
+        self.counters = {}
+        self.start_peak_rss_kb = peak_rss_kb()
+
+    def stage(self, name: str):
+        """
+        Context manager timing one execution of the stage `name`.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Add n to the counter `name`.
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def _record(self, name, elapsed, peak_growth):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {'calls': 0, 'seconds': 0.0, 'peak_rss_growth_kb': None, 'rss_kb': None}
+        entry['calls'] += 1
+        entry['seconds'] += elapsed
+        if peak_growth is not None:
+            entry['peak_rss_growth_kb'] = (entry['peak_rss_growth_kb'] or 0) + peak_growth
+        entry['rss_kb'] = current_rss_kb()
+
+    def report(self) -> dict:
+        peak = peak_rss_kb()
+        return {
+            'stages': self.stages,
+            'counters': self.counters,
+            'peak_rss_kb': peak,
+            'peak_rss_growth_kb': None if peak is None else peak - self.start_peak_rss_kb,
+        }
+
+    def dump(self, file_path: str, **extra) -> None:
+        """
+        Write the report, plus any extra top-level fields, as JSON.
+        """
+        with open(file_path, 'w') as f:
+            json.dump({**extra, **self.report()}, f, indent=2)
+
+_NULL_STAGE = nullcontext()
+
+# Shared by the pipeline functions; SingleFileProcessor switches it on per file
+profiler = StageProfiler()
+
 def get_layer_gates(dag):
     gate_layer_list = []
     for item in dag.layers():
@@ -182,39 +624,203 @@ def get_layer_gates(dag):
         gate_layer_list.append(gate_layer)
     return gate_layer_list
 
-def partition_from_DAG(dag, coupling_graph):
-    gate_layer_list = get_layer_gates(dag)
-    num_of_gate = 0
-    last_index = 0
-    partition_gates = []
-    for i in range(len(gate_layer_list)):
-        #print(i)
-        #print(last_index)
-        merge_gates = sum(gate_layer_list[last_index:i+1], [])
-        tmp_graph = nx.Graph()
-        tmp_graph.add_edges_from(merge_gates)
-        connected_components = list(nx.connected_components(tmp_graph))
-        isIso = True
-        for idx, component in enumerate(connected_components, 1):
-            subgraph = tmp_graph.subgraph(component)
-            if len(subgraph.edges()) == nx.diameter(subgraph): #path-tolopology, must sub_iso
+class IncrementalPartitioner:
+    """
+    Grows one partition layer by layer while keeping the running interaction graph.
+
+    The connected components of the merged gates are tracked with a union-find
+    structure, so adding a layer only merges and re-checks the components that
+    the layer touches. Components that are simple paths are always embeddable and
+    skip the subgraph-isomorphism check.
+    """
+
+    def __init__(self, architecture):
+        """
+        Parameters:
+        architecture (Architecture): Hardware architecture the partition must embed into.
+        """
+        self.architecture = architecture
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Start a new, empty partition.
+        """
+        self.gates = []
+        self.order = {}
+        self.parent = {}
+        self.degree = {}
+        self.comp_nodes = {}
+        self.comp_edges = {}
+        self.edge_order = {}
+
+    def _find(self, q: int) -> int:
+        root = q
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[q] != root:
+            self.parent[q], q = root, self.parent[q]
+        return root
+
+    def _union(self, r0: int, r1: int) -> int:
+        if len(self.comp_nodes[r0]) < len(self.comp_nodes[r1]):
+            r0, r1 = r1, r0
+        self.parent[r1] = r0
+        self.comp_nodes[r0] |= self.comp_nodes.pop(r1)
+        self.comp_edges[r0] |= self.comp_edges.pop(r1)
+        return r0
+
+    def _add_gate(self, q0: int, q1: int) -> None:
+        for q in (q0, q1):
+            if q not in self.parent:
+                self.order[q] = len(self.order)
+                self.parent[q] = q
+                self.degree[q] = 0
+                self.comp_nodes[q] = {q}
+                self.comp_edges[q] = set()
+        edge = (q0, q1) if q0 < q1 else (q1, q0)
+        r0, r1 = self._find(q0), self._find(q1)
+        if edge in self.comp_edges[r0]:
+            return
+        self.edge_order[edge] = (len(self.edge_order), (q0, q1))
+        self.degree[q0] += 1
+        self.degree[q1] += 1
+        root = r0 if r0 == r1 else self._union(r0, r1)
+        self.comp_edges[root].add(edge)
+
+    def _is_path(self, root: int) -> bool:
+        nodes = self.comp_nodes[root]
+        if len(self.comp_edges[root]) != len(nodes) - 1:
+            return False
+        return all(self.degree[q] <= 2 for q in nodes)
+
+    def add_layer(self, layer: list[list[int]]) -> bool:
+        """
+        Try to merge one gate layer into the current partition.
+
+        Parameters:
+        layer (list[list[int]]): The 2-qubit gates of one ASAP layer.
+
+        Returns:
+        bool: True if every component touched by the layer still embeds into the
+        coupling graph. On False the internal state is no longer valid and the
+        caller must ``reset`` before adding more layers.
+        """
+        for q0, q1 in layer:
+            self._add_gate(q0, q1)
+        touched = {self._find(gate[0]) for gate in layer}
+        for root in touched:
+            if self._is_path(root): #path-tolopology, must sub_iso
+                profiler.count('partition.path_skips')
                 continue
-            # print(subgraph.edges())
-            if not rx_is_subgraph_iso(coupling_graph, subgraph):
-                isIso = False
-                break
-        if isIso:
-            if i == len(gate_layer_list) - 1:
-                merge_gates = sum(gate_layer_list[last_index: i+1], [])
-                partition_gates.append(merge_gates)
-            continue
-        else:
-            merge_gates = sum(gate_layer_list[last_index: i], [])
-            partition_gates.append(merge_gates)
-            last_index = i
-            if i == len(gate_layer_list) - 1:
-                merge_gates = sum(gate_layer_list[last_index: i+1], [])
-                partition_gates.append(merge_gates)
+            profiler.count('partition.iso_checks')
+            # Rebuild the component in first-appearance order, as VF2 run time depends on it
+            subgraph = nx.Graph()
+            subgraph.add_nodes_from(sorted(self.comp_nodes[root], key=self.order.get))
+            edges = sorted(self.comp_edges[root], key=self.edge_order.get)
+            subgraph.add_edges_from(self.edge_order[e][1] for e in edges)
+            if not iso_cache.is_subgraph_iso(self.architecture, subgraph):
+                return False
+        self.gates.extend(layer)
+        return True
+
+
+def get_asap_layer_index(gate_list) -> np.ndarray:
+    """
+    Assign every 2-qubit gate its ASAP layer from per-qubit depth counters.
+
+    Parameters:
+    gate_list (list[tuple[int, int]]): 2-qubit gates in program order.
+
+    Returns:
+    np.ndarray: The layer index of each gate.
+    """
+    gates = np.asarray(gate_list, dtype=np.int64).reshape(-1, 2)
+    if len(gates) == 0:
+        return np.zeros(0, dtype=np.int64)
+    depth = [0] * (int(gates.max()) + 1)
+    layer_index = []
+    for q0, q1 in gates.tolist():
+        layer = depth[q0] if depth[q0] > depth[q1] else depth[q1]
+        depth[q0] = depth[q1] = layer + 1
+        layer_index.append(layer)
+    return np.asarray(layer_index, dtype=np.int64)
+
+def get_asap_layers(gate_list) -> list[list[list[int]]]:
+    """
+    Group 2-qubit gates into ASAP layers without building a QuantumCircuit/DAGCircuit.
+
+    Gives the same layers, in the same order, as ``get_layer_gates`` on the DAG
+    of ``gates_list_to_QC(gate_list)``.
+
+    Parameters:
+    gate_list (list[tuple[int, int]]): 2-qubit gates in program order.
+
+    Returns:
+    list[list[list[int]]]: The gates of each layer as [q0, q1] pairs.
+    """
+    return LayeredCircuit(gate_list).layers()
+
+class LayeredCircuit:
+    """
+    The 2-qubit gates of a circuit and their ASAP layers, kept in read-only NumPy
+    arrays. A circuit is parsed and layered once and the arrays can then be shared
+    by every compile of it (e.g. by forked sweep workers, copy-on-write).
+
+    Attributes:
+    gates (np.ndarray): (gates, 2) qubit pairs in program order.
+    layered_gates (np.ndarray): The same pairs ordered by ASAP layer (stable).
+    layer_offsets (np.ndarray): Start of every layer in layered_gates, plus the end.
+    """
+
+    def __init__(self, gate_list) -> None:
+        gates = np.asarray(gate_list, dtype=np.int64).reshape(-1, 2)
+        layer_index = get_asap_layer_index(gates)
+        self.gates = gates
+        self.layered_gates = gates[np.argsort(layer_index, kind='stable')]
+        self.layer_offsets = np.zeros(int(layer_index.max(initial=-1)) + 2, dtype=np.int64)
+        self.layer_offsets[1:] = np.cumsum(np.bincount(layer_index))
+        for array in (self.gates, self.layered_gates, self.layer_offsets):
+            array.flags.writeable = False
+
+    @classmethod
+    def from_qasm(cls, file: str, path: str) -> 'LayeredCircuit':
+        return cls(load_2q_gates_list(file, path))
+
+    def __len__(self) -> int:
+        return len(self.gates)
+
+    @property
+    def num_qubits(self) -> int:
+        return int(self.gates.max(initial=-1)) + 1
+
+    @property
+    def depth(self) -> int:
+        return len(self.layer_offsets) - 1
+
+    def gate_list(self) -> list[tuple[int, int]]:
+        return [tuple(gate) for gate in self.gates.tolist()]
+
+    def layers(self) -> list[list[list[int]]]:
+        if self.depth == 0:
+            return []
+        return [layer.tolist() for layer in np.split(self.layered_gates, self.layer_offsets[1:-1])]
+
+def partition_from_DAG(dag, architecture):
+    return partition_from_layers(get_layer_gates(dag), architecture)
+
+def partition_from_layers(gate_layer_list, architecture):
+    partition_gates = []
+    partitioner = IncrementalPartitioner(architecture)
+    profiler.count('partition.layers', len(gate_layer_list))
+    for layer in gate_layer_list:
+        if not partitioner.add_layer(layer):
+            partition_gates.append(partitioner.gates)
+            partitioner.reset()
+            partitioner.add_layer(layer)
+    if gate_layer_list:
+        partition_gates.append(partitioner.gates)
+    profiler.count('partition.partitions', len(partition_gates))
 
     return partition_gates
 
@@ -248,74 +854,312 @@ def euclidean_distance(node1, node2):
     x2, y2 = node2
     return math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
 
-def generate_grid_with_Rb(n, m, Rb):
-    G = nx.grid_2d_graph(n, m)  # 生成n*m的网格图
-    for node1 in G.nodes():
-        for node2 in G.nodes():
-            if node1 != node2:
-                distance = euclidean_distance(node1, node2)
-                if distance <= Rb:
-                    G.add_edge(node1, node2)
+@lru_cache(maxsize=None)
+def get_Rb_stencil(Rb) -> tuple[tuple[int, int], ...]:
+    """
+    Integer grid offsets (dx, dy) with 0 < distance <= Rb, in lexicographic order.
 
-    return G
+    Only the "forward" half (dx > 0, or dx == 0 and dy > 0) is returned; each
+    undirected edge is generated once from its row-major smaller endpoint.
 
-def extend_graph(coupling_graph, arch_size, Rb):
-    coupling_graph = generate_grid_with_Rb(arch_size+1, arch_size+1, Rb)
-    return coupling_graph
+    Parameters:
+    Rb (float): Interaction radius (need not be an integer).
 
+    Returns:
+    tuple[tuple[int, int], ...]: The forward offsets within Rb.
+    """
+    reach = int(math.floor(Rb)) if Rb >= 0 else -1
+    stencil = []
+    for dx in range(0, reach + 1):
+        for dy in range(-reach, reach + 1):
+            if (dx, dy) > (0, 0) and euclidean_distance((0, 0), (dx, dy)) <= Rb:
+                stencil.append((dx, dy))
+    return tuple(stencil)
+
+def _grid_edges_with_Rb(n, m, Rb):
+    """
+    Yield the coupling edges of an n*m grid in the order ``G.edges()`` reports
+    them for the graph built by nx.grid_2d_graph plus the Rb pair loop: per
+    row-major node, its down/right grid neighbours first, then the remaining
+    forward stencil neighbours.
+    """
+    stencil = [offset for offset in get_Rb_stencil(Rb) if offset not in ((1, 0), (0, 1))]
+    for i in range(n):
+        for j in range(m):
+            if i + 1 < n:
+                yield (i, j), (i + 1, j)
+            if j + 1 < m:
+                yield (i, j), (i, j + 1)
+            for dx, dy in stencil:
+                x, y = i + dx, j + dy
+                if x < n and 0 <= y < m:
+                    yield (i, j), (x, y)
+
+def generate_grid_with_Rb(n, m, Rb, output="networkx"):
+    """
+    Generate the n*m grid coupling graph where sites within distance Rb interact.
 
-def map2list(mapping, num_q):
-    map_list = [-1] * num_q
-    for key, value in mapping.items():
-        map_list[key] = value
+    Edges are added by a precomputed stencil of offsets within Rb instead of
+    testing every pair of sites.
 
-    return map_list
+    Parameters:
+    n (int): Number of rows.
+    m (int): Number of columns.
+    Rb (float): Interaction radius.
+    output (str): "networkx" for an nx.Graph with (x, y) nodes, "rustworkx" for a
+    PyGraph equal to ``rx.networkx_converter`` of that graph, or "csr" for an
+    (indptr, indices) adjacency over row-major site indices.
 
-def complete_mapping(i, embeddings, indices, coupling_graph):
+    Returns:
+    The coupling graph in the requested representation.
+    """
+    if output == "networkx":
+        G = nx.grid_2d_graph(n, m)  # 生成n*m的网格图
+        G.add_edges_from(_grid_edges_with_Rb(n, m, Rb))
+        return G
+    if output == "rustworkx":
+        G = rx.PyGraph()
+        G.add_nodes_from([(i, j) for i in range(n) for j in range(m)])
+        G.add_edges_from([(u[0] * m + u[1], v[0] * m + v[1], {}) for u, v in _grid_edges_with_Rb(n, m, Rb)])
+        return G
+    if output == "csr":
+        edges = np.array([(u[0] * m + u[1], v[0] * m + v[1]) for u, v in _grid_edges_with_Rb(n, m, Rb)],
+                         dtype=np.int64).reshape(-1, 2)
+        src = np.concatenate([edges[:, 0], edges[:, 1]])
+        dst = np.concatenate([edges[:, 1], edges[:, 0]])
+        order = np.lexsort((dst, src))
+        indptr = np.zeros(n * m + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n * m), out=indptr[1:])
+        return indptr, dst[order]
+    raise ValueError(f"Unknown coupling graph output: {output}")
+
+def extend_graph(architecture):
+    architecture.grow()
+    return architecture
+
+
+class Architecture:
+    """
+    Square-grid hardware architecture shared by every isomorphism query.
+
+    The coupling graph is converted to rustworkx once, together with the
+    node-index <-> coordinate tables, so VF2 queries only convert the (small)
+    logical graph.
+    """
+
+    def __init__(self, arch_size: int, Rb: float) -> None:
+        """
+        Parameters:
+        arch_size (int): Number of rows/columns of the square grid.
+        Rb (float): Interaction radius.
+        """
+        self.arch_size = arch_size
+        self.Rb = Rb
+        graph = generate_grid_with_Rb(arch_size, arch_size, Rb)
+        rx_graph = generate_grid_with_Rb(arch_size, arch_size, Rb, output="rustworkx")
+        self.graph = graph
+        # The coupling graph is fully determined by the grid size and Rb
+        self.key = (arch_size, Rb)
+        self.rx_graph = rx_graph
+        self.nodes = list(graph.nodes())
+        self.node_index = {node: index for index, node in enumerate(self.nodes)}
+        self.coords = np.array(self.nodes, dtype=np.int64).reshape(-1, 2)
+        self.adjacency = [set(rx_graph.neighbors(index)) for index in range(len(self.nodes))]
+        self._hop_distances = None
+        self._site_grid = None
+
+    @property
+    def hop_distances(self) -> np.ndarray:
+        """
+        All-pairs hop distances between sites (indexed like ``nodes``), computed once per grid.
+        """
+        if self._hop_distances is None:
+            self._hop_distances = rx.distance_matrix(self.rx_graph).astype(np.int64)
+        return self._hop_distances
+
+    def site_indices(self, coords) -> np.ndarray:
+        """
+        Node indices (as in ``nodes``) of an (n, 2) array of grid coordinates.
+        """
+        if self._site_grid is None:
+            extent = self.coords.max(axis=0) + 1
+            self._site_grid = np.full(extent, -1, dtype=np.int64)
+            self._site_grid[self.coords[:, 0], self.coords[:, 1]] = np.arange(len(self.nodes))
+        coords = np.asarray(coords).reshape(-1, 2)
+        return self._site_grid[coords[:, 0], coords[:, 1]]
+
+    def grow(self) -> list[tuple[int, int]]:
+        """
+        Grow the grid in place by one ring of sites (one new row and column).
+
+        Only the edges touching the new sites are added, to both the networkx
+        graph and the rustworkx handle; existing node indices are kept, so the
+        coordinate tables are extended rather than rebuilt.
+
+        Returns:
+        list[tuple[int, int]]: The added sites.
+        """
+        k = self.arch_size
+        new_sites = [(i, k) for i in range(k)] + [(k, j) for j in range(k + 1)]
+        self.arch_size = k + 1
+        self.key = (self.arch_size, self.Rb)
+        self._hop_distances = None
+        self._site_grid = None
+        for site in new_sites:
+            self.graph.add_node(site)
+            self.node_index[site] = self.rx_graph.add_node(site)
+            self.nodes.append(site)
+            self.adjacency.append(set())
+        self.coords = np.vstack([self.coords, np.array(new_sites, dtype=np.int64)])
+        neighbourhood = {(1, 0), (0, 1)} | set(get_Rb_stencil(self.Rb))
+        neighbourhood |= {(-dx, -dy) for dx, dy in neighbourhood}
+        for x, y in new_sites:
+            for dx, dy in sorted(neighbourhood):
+                other = (x + dx, y + dy)
+                if other in self.node_index and not self.graph.has_edge((x, y), other):
+                    self.graph.add_edge((x, y), other)
+                    u, v = self.node_index[(x, y)], self.node_index[other]
+                    self.rx_graph.add_edge(u, v, {})
+                    self.adjacency[u].add(v)
+                    self.adjacency[v].add(u)
+        return new_sites
+
+
+class Embedding:
+    """
+    Positions of all qubits for one partition, backed by a single (num_qubits, 2)
+    integer array. Unplaced qubits hold (-1, -1).
+
+    Any integer array can back an embedding (e.g. a read-only view of a
+    memory-mapped embedding store); arithmetic is always done in int64.
+    Indexing a single qubit gives the historical ``(x, y)`` tuple, or -1 if the
+    qubit is unplaced.
+    """
+    __slots__ = ('coords',)
+
+    def __init__(self, coords) -> None:
+        """
+        Parameters:
+        coords: (num_qubits, 2) integer array-like, or a list of (x, y) pairs with -1 for unplaced qubits.
+        """
+        if isinstance(coords, Embedding):
+            coords = coords.coords
+        elif not isinstance(coords, np.ndarray):
+            coords = [(-1, -1) if isinstance(position, int) and position == -1 else position for position in coords]
+        coords = np.asarray(coords)
+        if coords.dtype.kind not in 'iu':
+            coords = coords.astype(np.int32)
+        self.coords = coords.reshape(-1, 2)
+
+    @classmethod
+    def unplaced(cls, num_q: int) -> 'Embedding':
+        return cls(np.full((num_q, 2), -1, dtype=np.int32))
+
+    @classmethod
+    def from_mapping(cls, mapping: dict, num_q: int) -> 'Embedding':
+        """
+        Parameters:
+        mapping (dict): {logical_qubit: (x, y)}; qubits missing from it stay unplaced.
+        num_q (int): Number of qubits.
+        """
+        embedding = cls.unplaced(num_q)
+        if mapping:
+            embedding.coords[list(mapping.keys())] = list(mapping.values())
+        return embedding
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None and dtype != self.coords.dtype:
+            return self.coords.astype(dtype)
+        return self.coords.copy() if copy else self.coords
+
+    def __getitem__(self, qubit: int):
+        x, y = self.coords[qubit].tolist()
+        return -1 if x < 0 else (x, y)
+
+    def __setitem__(self, qubit: int, position) -> None:
+        self.coords[qubit] = (-1, -1) if isinstance(position, int) and position == -1 else position
+
+    def __eq__(self, other) -> bool:
+        return np.array_equal(self.coords, np.asarray(Embedding(other)))
+
+    def __str__(self) -> str:
+        return str(self.tolist())
+
+    def __repr__(self) -> str:
+        return f"Embedding({self.tolist()})"
+
+    def tolist(self) -> list:
+        """Historical list form: one (x, y) tuple per qubit, -1 for unplaced qubits."""
+        return [-1 if x < 0 else (x, y) for x, y in self.coords.tolist()]
+
+    def copy(self) -> 'Embedding':
+        return Embedding(self.coords.copy())
+
+    @property
+    def placed(self) -> np.ndarray:
+        """Boolean mask of the placed qubits."""
+        return self.coords[:, 0] >= 0
+
+    def unplaced_qubits(self) -> np.ndarray:
+        return np.flatnonzero(~self.placed)
+
+    def displacement(self, other) -> np.ndarray:
+        """(num_qubits, 2) move of every qubit from this embedding to `other`."""
+        return np.asarray(other, dtype=np.int64) - self.coords.astype(np.int64)
+
+    def moved_qubits(self, other) -> np.ndarray:
+        """Qubits whose position differs in `other`."""
+        return np.flatnonzero((np.asarray(other) != self.coords).any(axis=1))
+
+    def distances(self, other) -> np.ndarray:
+        """Euclidean move distance of every qubit from this embedding to `other`."""
+        delta = self.displacement(other)
+        return np.sqrt((delta * delta).sum(axis=1))
+
+def complete_mapping(i, embeddings, indices, architecture):
+    """
+    Place the qubits of embedding i that no gate of partition i pins down.
+
+    All idle qubits are placed together with a min-cost assignment over the
+    free sites. Putting a qubit on a site costs the hop distance from its
+    previous position plus the hop distance to its next pinned position (the
+    total movement over the two transitions). Ties prefer staying in place.
+
+    Parameters:
+    i (int): Index of the embedding to complete.
+    embeddings (list[Embedding]): All embeddings; embeddings[i-1] is already complete.
+    indices (list[int]): The unplaced qubits of embeddings[i].
+    architecture (Architecture): Hardware architecture (provides the hop-distance table).
+
+    Returns:
+    Embedding: The completed embedding (updated in place).
+    """
     cur_map = embeddings[i]
-    unoccupied = [value for value in coupling_graph.nodes() if value not in cur_map]
-    for index in indices:
-        flag = False
-        if i != 0:  #If pre_map is not empty
-            if embeddings[i-1][index] in unoccupied:
-                cur_map[index] = embeddings[i-1][index]
-                flag = True
-                unoccupied.remove(cur_map[index])
-        if i != len(embeddings) - 1 and flag == False:
-            for j in range(i+1, len(embeddings)):
-                if embeddings[j][index] != -1 and embeddings[j][index] in unoccupied:
-                    cur_map[index] = embeddings[j][index]
-                    unoccupied.remove(cur_map[index])
-                    flag = True
-                    break
-        if flag == False:
-            if i != 0:
-                source = embeddings[i-1][index]
-                node_of_shortest = dict()
-                for node in unoccupied:
-                    distance = nx.shortest_path_length(coupling_graph, source=source, target=node)
-                    node_of_shortest[node] = distance
-                min_node = min(node_of_shortest, key=node_of_shortest.get)
-                cur_map[index] = min_node
-                unoccupied.remove(min_node)
-                flag = True
-            elif i != len(embeddings) - 1:
-                for j in range(i+1, len(embeddings)):
-                    if embeddings[j][index] != -1:
-                        source = embeddings[j][index]
-                        node_of_shortest = dict()
-                        for node in unoccupied:
-                            distance = nx.shortest_path_length(coupling_graph, source=source, target=node)
-                            node_of_shortest[node] = distance
-                        min_node = min(node_of_shortest, key=node_of_shortest.get)
-                        cur_map[index] = min_node
-                        unoccupied.remove(min_node)
-                        flag = True
-                        break
-        if flag == False:
-            min_node = random.choice(unoccupied)
-            cur_map[index] = min_node
-            unoccupied.remove(min_node)
+    indices = np.asarray(indices, dtype=np.int64)
+    free = np.ones(len(architecture.nodes), dtype=bool)
+    free[architecture.site_indices(cur_map.coords[cur_map.placed])] = False
+    free_sites = np.flatnonzero(free)
+    hops = architecture.hop_distances
+
+    cost = np.zeros((len(indices), len(free_sites)))
+    if i != 0:  #If pre_map is not empty
+        distance = hops[np.ix_(architecture.site_indices(embeddings[i-1].coords[indices]), free_sites)]
+        cost += 2 * distance + (distance > 0)
+    # Next pinned position of each qubit, if any
+    pending = np.arange(len(indices))
+    for j in range(i+1, len(embeddings)):
+        if len(pending) == 0:
+            break
+        pinned = embeddings[j].placed[indices[pending]]
+        rows = pending[pinned]
+        sites = architecture.site_indices(embeddings[j].coords[indices[rows]])
+        cost[rows] += 2 * hops[np.ix_(sites, free_sites)]
+        pending = pending[~pinned]
+    rows, cols = linear_sum_assignment(cost)
+    cur_map.coords[indices[rows]] = architecture.coords[free_sites[cols]]
     return cur_map
 
 
@@ -389,31 +1233,76 @@ def check_intersect_ver2(gate1, gate2, coupling_graph, mapping, r_re):
     else:
         return False
 
+@lru_cache(maxsize=None)
+def max_squared_distance_within(r_re) -> int:
+    """
+    Largest integer squared distance d2 with sqrt(d2) <= r_re.
+
+    Grid coordinates are integers, so comparing squared distances against this
+    threshold gives exactly the same answer as ``euclidean_distance(...) <= r_re``.
+    """
+    if r_re < 0:
+        return -1
+    d2 = int(r_re * r_re) + 1
+    while d2 >= 0 and math.sqrt(d2) > r_re:
+        d2 -= 1
+    return d2
+
+def _near_packed_endpoint(cells, x, y, cell, limit):
+    cx, cy = x // cell, y // cell
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for px, py in cells.get((cx + dx, cy + dy), ()):
+                if (px - x) * (px - x) + (py - y) * (py - y) <= limit:
+                    return True
+    return False
+
+def pack_parallel_gates(layer, mapping, r_re):
+    """
+    Greedily pack one gate layer into gate cycles.
+
+    Same result as repeatedly taking the first remaining gate and every later
+    gate whose endpoints are all farther than r_re from the endpoints already
+    packed (``check_intersect_ver2``). Packed endpoints are bucketed into a
+    uniform grid of cell size r_re, so each candidate is checked only against
+    the neighbouring cells, with squared distances.
+
+    Parameters:
+    layer (list[list[int]]): Gates of one ASAP layer, in order.
+    mapping (list): Position (x, y) of each qubit.
+    r_re (float): Extended (restriction) radius.
+
+    Returns:
+    list[list[list[int]]]: The gate cycles of the layer.
+    """
+    limit = max_squared_distance_within(r_re)
+    cell = r_re if r_re > 0 else 1
+    cycles = []
+    remaining = layer
+    while remaining:
+        cells = {}
+        parallel_gates = []
+        rest = []
+        for gate in remaining:
+            ends = (mapping[gate[0]], mapping[gate[1]])
+            if any(_near_packed_endpoint(cells, x, y, cell, limit) for x, y in ends):
+                rest.append(gate)
+                continue
+            parallel_gates.append(gate)
+            for x, y in ends:
+                cells.setdefault((x // cell, y // cell), []).append((x, y))
+        cycles.append(parallel_gates)
+        remaining = rest
+    return cycles
+
 def get_parallel_gates(gates, coupling_graph, mapping, r_re):
     gates_list = []
-    _, dag = gates_list_to_QC(gates)
-    gate_layer_list = get_layer_gates(dag)
+    gate_layer_list = get_asap_layers(gates)
+    # Plain per-qubit [x, y] lists are the fastest to index in the packing loop
+    positions = np.asarray(mapping).tolist()
 
     for items in gate_layer_list:
-        gates_copy = deepcopy(items)
-        while(len(gates_copy) != 0):
-            parallel_gates = []
-            parallel_gates.append(gates_copy[0])
-            for i in range(1, len(gates_copy)):
-                flag = True
-                for gate in parallel_gates:
-                    if check_intersect_ver2(gate, gates_copy[i], coupling_graph, mapping, r_re):
-                        continue
-                    else:
-                        flag = False
-                        break
-                if flag:
-                    parallel_gates.append(gates_copy[i])
-
-            for gate in parallel_gates:
-                gates_copy.remove(gate)
-            gates_list.append(parallel_gates)
-            #print("parl:",parallel_gates)
+        gates_list.extend(pack_parallel_gates(items, positions, r_re))
     return gates_list
 
 '''def set_parameters(default):
@@ -466,108 +1355,444 @@ def set_parameters(T_cz = 0.2, T_eff = 1.5e6, T_trans=20, AOD_width=3,AOD_height
     move_fidelity = math.exp(-t_move/para['T_eff'])
     return t_idle, Fidelity, move_fidelity'''
 
+class FidelityAccumulator:
+    """
+    Incremental fidelity/time model of a compiled circuit.
+
+    Gate cycles and move stages are added as they are produced; the running
+    totals are kept as scalars and can be read in O(1) at any point. Since time
+    only grows, `fidelity` never increases as more is added, so a caller can stop
+    evaluating a candidate as soon as it drops below a threshold.
+
+    Gate cycles added before the first move stage seed the total time, which the
+    stage times are then added to one by one; adding all gate cycles first (as
+    compute_fidelity does) therefore sums in the original order.
+
+    Parameters:
+    num_q (int): Number of qubits.
+    gate_num (int): Number of CZ gates of the circuit.
+    para (dict): Hardware parameters (default: set_parameters()).
+    """
+
+    def __init__(self, num_q: int, gate_num: int, para: dict = None) -> None:
+        self.para = set_parameters() if para is None else para
+        self.num_q = num_q
+        self.gate_num = gate_num
+        self.gate_cycles = 0
+        self.t_move = 0
+        self.num_trans = 0
+        self.num_move = 0
+        self.all_move_dis = 0
+        self.num_stages = 0
+        # Time of the stages, seeded with the gate cycles added before the first stage
+        self._time = 0
+        # Gate cycles added after the first stage
+        self._late_gate_cycles = 0
+        self._scale = np.array([self.para['AOD_width'], self.para['AOD_height']], dtype=float)
+
+    def add_gate_cycles(self, cycles) -> None:
+        """
+        Add parallel gate cycles, given as a list of cycles or as their number.
+        """
+        num_cycles = int(cycles) if isinstance(cycles, numbers.Integral) else len(cycles)
+        self.gate_cycles += num_cycles
+        if self.num_stages == 0:
+            self._time = self.gate_cycles * self.para['T_cz'] # cz execution time, parallel
+        else:
+            self._late_gate_cycles += num_cycles
+
+    def add_move_stage(self, stage) -> None:
+        """
+        Add one move stage, i.e. moves executed in parallel by the AOD.
+
+        Parameters:
+        stage: list of [qubit_id, (x1, y1), (x2, y2)], or an array whose last four
+               columns are x1, y1, x2, y2 (e.g. the rows of a MoveScheduleWriter stage).
+        """
+        if isinstance(stage, np.ndarray):
+            moves = stage[:, -4:]
+        else:
+            moves = np.array([each_move[1] + each_move[2] for each_move in stage], dtype=float).reshape(-1, 4)
+        if len(moves):
+            dis = ((np.abs(moves[:, 2:] - moves[:, :2]) * self._scale) ** 2).sum(axis=1)
+            max_dis = math.sqrt(dis.max())
+        else:
+            max_dis = 0.0
+        self.num_stages += 1
+        self._time += (4 * self.para['T_trans']) # pick/drop/pick/drop
+        self._time += (max_dis/self.para['Move_speed'])
+        self.t_move += (4 * self.para['T_trans'])
+        self.t_move += (max_dis/self.para['Move_speed'])
+        self.num_trans += 4
+        self.num_move += len(moves)
+        self.all_move_dis += max_dis
+
+    def add_move_stages(self, stages) -> None:
+        for stage in stages:
+            self.add_move_stage(stage)
+
+    @property
+    def t_total(self) -> float:
+        if self._late_gate_cycles:
+            return self._time + self._late_gate_cycles * self.para['T_cz']
+        return self._time
+
+    @property
+    def t_idle(self) -> float:
+        return self.num_q * self.t_total - self.gate_num * self.para['T_cz']
+
+    @property
+    def fidelity(self) -> float:
+        return math.exp(-self.t_idle/self.para['T_eff']) * (self.para['F_cz']**self.gate_num) * (self.para['F_trans'] ** self.num_trans)
+
+    @property
+    def move_fidelity(self) -> float:
+        return math.exp(-self.t_move/self.para['T_eff'])
+
+    def result(self) -> tuple:
+        """
+        Returns:
+        tuple: (idle time, fidelity, movement fidelity, total time, transfers, moves, total move distance),
+               as returned by compute_fidelity.
+        """
+        t_total = self.t_total
+        t_idle = self.num_q * t_total - self.gate_num * self.para['T_cz']
+        Fidelity = math.exp(-t_idle/self.para['T_eff']) * (self.para['F_cz']**self.gate_num) * (self.para['F_trans'] ** self.num_trans)
+        return t_idle, Fidelity, self.move_fidelity, t_total, self.num_trans, self.num_move, self.all_move_dis
+
 def compute_fidelity(parallel_gates, all_movements, num_q, gate_num, para=None):
-    if para is None:
-        para = set_parameters()
-    t_total = 0
-    t_total += (len(parallel_gates) * para['T_cz']) # cz execution time, parallel
-    t_move = 0
-    num_trans = 0
-    num_move = 0
-    all_move_dis = 0
+    accumulator = FidelityAccumulator(num_q, gate_num, para)
+    accumulator.add_gate_cycles(parallel_gates)
     for move_stage in all_movements:
-        # 每个 move_stage 是一个移动阶段，包含多个移动步骤
-        for move_step in move_stage:
-            # 每个 move_step 是一个步骤，包含可以并行执行的移动
-            t_total += (4 * para['T_trans']) # pick/drop/pick/drop
-            t_move += (4 * para['T_trans'])
-            num_trans += 4
-            max_dis = 0
-            for each_move in move_step:
-                # 每个 each_move 是 [qubit_id, (x1,y1), (x2,y2)]
-                num_move += 1
-                x1, y1 = each_move[1][0], each_move[1][1]
-                x2, y2 = each_move[2][0], each_move[2][1]
-                dis = (abs(x2-x1)*para['AOD_width'])**2 + (abs(y2-y1)*para['AOD_height'])**2
-                if dis > max_dis:
-                    max_dis = dis
-            max_dis = math.sqrt(max_dis)
-            all_move_dis += max_dis
-            t_total += (max_dis/para['Move_speed'])
-            t_move += (max_dis/para['Move_speed'])
-
-    t_idle = num_q * t_total - gate_num * para['T_cz']
-    Fidelity = math.exp(-t_idle/para['T_eff']) * (para['F_cz']**gate_num) * (para['F_trans'] ** num_trans)
-    move_fidelity = math.exp(-t_move/para['T_eff'])
-    return t_idle, Fidelity, move_fidelity, t_total, num_trans, num_move, all_move_dis
+        # 每个 move_stage 是一个移动阶段，包含多个可以并行执行的移动步骤
+        accumulator.add_move_stages(move_stage)
+    return accumulator.result()
 
-def get_embeddings(partition_gates, coupling_graph, num_q, arch_size, Rb, 
+def get_embeddings(partition_gates, architecture, num_q,
                   initial_mapping=None, optimize_movement=True, 
-                  max_candidates=50, idle_weight=0.3):
+                  max_candidates=50, idle_weight=0.3,
+                  search_strategy="vf2", expansion_budget=5000):
     """
     获取每个分区的嵌入映射
     
     参数:
         partition_gates: 分区门列表
-        coupling_graph: 硬件拓扑图
+        architecture: 硬件架构（Architecture），分区放不下时原地扩展，调用方可读取最终的 arch_size
         num_q: 量子比特数
-        arch_size: 网格大小
-        Rb: 交互半径
         initial_mapping: 初始映射（可选）
         optimize_movement: 是否启用移动优化（默认True）
         max_candidates: VF2 候选解数量（默认50）
         idle_weight: 闲置量子比特权重（默认0.3）
+        search_strategy: 映射搜索策略，"vf2"（前 N 个 VF2 解中选最优，默认）或 "bnb"（按移动代价剪枝的分支限界）
+        expansion_budget: "bnb" 策略的搜索节点扩展预算（默认5000）
     
     返回:
-        embeddings: 嵌入列表
-        extend_position: 扩展位置列表
+        embeddings: 嵌入列表（Embedding，每个量子比特一行坐标）
+        extend_position: 扩展位置列表（每扩展一圈记录一次分区下标）
     """
     embeddings = []
     begin_index = 0
     extend_position = []
     if initial_mapping:
-        embeddings.append(initial_mapping)
+        embeddings.append(Embedding(initial_mapping))
         begin_index = 1
     
     for i in range(begin_index, len(partition_gates)):
         tmp_graph = nx.Graph()
         tmp_graph.add_edges_from(partition_gates[i])
-        if not rx_is_subgraph_iso(coupling_graph, tmp_graph):
-            coupling_graph = extend_graph(coupling_graph, arch_size, Rb)
-            extend_position.append(i)
         
         # === 核心优化逻辑 ===
         # 只有当开启优化、不是第一个分区、且有多于1个分区时才优化
-        next_embedding = None
-        if optimize_movement and i > 0 and len(partition_gates) > 1:
-            try:
-                next_embedding = get_best_mapping_with_inertia(
-                    tmp_graph, 
-                    coupling_graph, 
-                    num_q,
-                    prev_embedding=embeddings[i-1],
-                    current_gates=partition_gates[i],
-                    max_candidates=max_candidates,
-                    idle_weight=idle_weight
-                )
-            except Exception as e:
-                print(f"⚠️  优化失败于分区 {i}: {e}，回退到原版算法")
-                next_embedding = None
+        optimize = optimize_movement and i > 0 and len(partition_gates) > 1
         
-        # 如果优化失败或未启用，使用原版逻辑
-        if next_embedding is None:
-            next_embedding = get_rx_one_mapping(tmp_graph, coupling_graph)
+        # 一次 VF2 搜索同时给出映射和"放不下"的判定；放不下时扩展网格后重新搜索
+        while True:
+            fits = iso_cache.lookup(architecture, tmp_graph)
+            if fits is not None:
+                profiler.count('embedding.cache_hits')
+            next_embedding = None
+            if fits is not False:
+                with profiler.stage('embedding.search'):
+                    next_embedding = search_embedding(
+                        tmp_graph,
+                        architecture,
+                        num_q,
+                        prev_embedding=embeddings[i-1] if optimize else None,
+                        current_gates=partition_gates[i] if optimize else None,
+                        max_candidates=max_candidates,
+                        idle_weight=idle_weight,
+                        search_strategy=search_strategy,
+                        expansion_budget=expansion_budget
+                    )
+                if fits is None:
+                    iso_cache.store(architecture, tmp_graph, next_embedding is not None)
+            if next_embedding is not None:
+                break
+            if architecture.arch_size >= num_q:
+                raise ValueError(f"Partition {i} cannot be embedded for Rb={architecture.Rb}")
+            extend_graph(architecture)
+            extend_position.append(i)
+            profiler.count('embedding.grid_extensions')
         
-        next_embedding = map2list(next_embedding, num_q)
-        embeddings.append(next_embedding)
+        embeddings.append(Embedding.from_mapping(next_embedding, num_q))
 
     for i in range(begin_index, len(embeddings)):
-        indices = [index for index, value in enumerate(embeddings[i]) if value == -1]
-        if indices:
-            embeddings[i] = complete_mapping(i, embeddings, indices, coupling_graph)
+        indices = embeddings[i].unplaced_qubits()
+        if len(indices):
+            with profiler.stage('embedding.complete_mapping'):
+                embeddings[i] = complete_mapping(i, embeddings, indices, architecture)
 
     return embeddings, extend_position
 
+class ResultSink(ABC):
+    """
+    Destination of the per-circuit result rows. Rows are handed over as they are
+    produced, so a sink never needs the whole schedule in memory.
+    """
+
+    @abstractmethod
+    def write_row(self, row: list) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+class NullSink(ResultSink):
+    """Discards every row (used when circuit results are not saved)."""
+
+    def write_row(self, row: list) -> None:
+        pass
+
+class JsonlSink(ResultSink):
+    """One JSON array per line."""
+
+    def __init__(self, file_path: str) -> None:
+        self.file = open(file_path, 'w')
+
+    def write_row(self, row: list) -> None:
+        self.file.write(json.dumps(row, default=str) + '\n')
+
+    def close(self) -> None:
+        self.file.close()
+
+class CsvSink(ResultSink):
+    """One CSV record per row."""
+
+    def __init__(self, file_path: str) -> None:
+        self.file = open(file_path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+
+    def write_row(self, row: list) -> None:
+        self.writer.writerow(row)
+
+    def close(self) -> None:
+        self.file.close()
+
+class XlsxSink(ResultSink):
+    """
+    Excel sheet written with openpyxl's write-only mode, which streams the rows
+    to a temporary file instead of building the sheet in memory.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        from openpyxl import Workbook
+        self.file_path = file_path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+
+    def write_row(self, row: list) -> None:
+        self.sheet.append(row)
+
+    def close(self) -> None:
+        self.workbook.save(self.file_path)
+
+MOVE_SCHEDULE_MAGIC = b'DASMOV\x00\x01'
+
+class MoveScheduleWriter:
+    """
+    Binary writer of the move schedule, fed one transition at a time.
+
+    After the magic, every transition is an int32 stage count followed by its
+    stages; a stage is an int32 move count and that many int32 rows
+    [qubit, x_before, y_before, x_after, y_after] (all little endian).
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.file = open(file_path, 'wb')
+        self.file.write(MOVE_SCHEDULE_MAGIC)
+
+    def write_transition(self, stages: list[list]) -> None:
+        self.file.write(np.int32(len(stages)).astype('<i4').tobytes())
+        for stage in stages:
+            rows = np.array([[qubit, *before, *after] for qubit, before, after in stage], dtype='<i4').reshape(-1, 5)
+            self.file.write(np.int32(len(rows)).astype('<i4').tobytes())
+            self.file.write(rows.tobytes())
+
+    def close(self) -> None:
+        self.file.close()
+
+def read_move_schedule(file_path: str):
+    """
+    Read a file written by MoveScheduleWriter one transition at a time.
+
+    Yields:
+    list[list]: move stages of one transition, each a list of [qubit, (x1, y1), (x2, y2)].
+    """
+    with open(file_path, 'rb') as file:
+        if file.read(len(MOVE_SCHEDULE_MAGIC)) != MOVE_SCHEDULE_MAGIC:
+            raise ValueError(f"{file_path} is not a move schedule")
+        while True:
+            header = file.read(4)
+            if not header:
+                return
+            stages = []
+            for _ in range(int.from_bytes(header, 'little', signed=True)):
+                count = int.from_bytes(file.read(4), 'little', signed=True)
+                rows = np.frombuffer(file.read(count * 20), dtype='<i4').reshape(count, 5).tolist()
+                stages.append([[q, (x1, y1), (x2, y2)] for q, x1, y1, x2, y2 in rows])
+            yield stages
+
+RESULT_SINKS = {'xlsx': XlsxSink, 'csv': CsvSink, 'jsonl': JsonlSink}
+
+def open_result_sink(file_path_base: str, result_format: str = 'xlsx') -> ResultSink:
+    """
+    Parameters:
+    file_path_base (str): Output path without extension.
+    result_format (str): One of RESULT_SINKS ("xlsx", "csv", "jsonl").
+
+    Returns:
+    ResultSink: A sink writing to file_path_base + '.' + result_format.
+    """
+    if result_format not in RESULT_SINKS:
+        raise ValueError(f"Unknown result format: {result_format}")
+    return RESULT_SINKS[result_format](f"{file_path_base}.{result_format}")
+
+def resolve_embedding_options(**options) -> dict:
+    """
+    Fill in the defaults of the ``get_embeddings`` hyper-parameters.
+
+    Parameters:
+    **options: Hyper-parameters of get_embeddings (optimize_movement, max_candidates, ...).
+
+    Returns:
+    dict: Every hyper-parameter with its effective value.
+    """
+    parameters = inspect.signature(get_embeddings).parameters
+    defaults = {name: p.default for name, p in parameters.items()
+                if p.default is not inspect.Parameter.empty and name != 'initial_mapping'}
+    unknown = set(options) - set(defaults)
+    if unknown:
+        raise TypeError(f"Unknown embedding options: {sorted(unknown)}")
+    return {**defaults, **options}
+
+# Bump when partitioning or embedding results change for the same inputs
+COMPILE_CACHE_VERSION = 1
+
+def gate_list_digest(gate_list) -> str:
+    """
+    SHA-256 of a 2-qubit gate list, used to address cached compile results.
+    """
+    gates = np.ascontiguousarray(np.asarray(gate_list, dtype=np.int64).reshape(-1, 2))
+    return hashlib.sha256(gates.tobytes()).hexdigest()
+
+class CompileCache:
+    """
+    Content-addressed on-disk store of partitions and embeddings.
+
+    Entries are JSON files named by a hash of the circuit's gate list and every
+    setting the result depends on, including ``COMPILE_CACHE_VERSION``, so a
+    changed circuit or setting never returns a stale result. Writes go through a
+    temporary file and an atomic rename. When the directory grows beyond
+    ``max_bytes`` the least recently used entries are deleted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30) -> None:
+        """
+        Parameters:
+        cache_dir (str): Directory holding the entries (created if missing).
+        max_bytes (int): Size limit of the directory.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(kind: str, gates_digest: str, **settings) -> str:
+        """
+        Parameters:
+        kind (str): Kind of the entry, e.g. "partitions" or "embeddings".
+        gates_digest (str): ``gate_list_digest`` of the circuit.
+        **settings: Every setting the entry depends on (JSON serializable).
+
+        Returns:
+        str: The entry key.
+        """
+        payload = json.dumps({'version': COMPILE_CACHE_VERSION, 'gates': gates_digest, **settings}, sort_keys=True)
+        return f"{kind}-{hashlib.sha256(payload.encode()).hexdigest()}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key: str):
+        """
+        Returns:
+        The stored value, or None on a miss. Unreadable entries are dropped.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r') as file:
+                value = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted concurrently; the value has already been read
+        return value
+
+    def put(self, key: str, value) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(value, file)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Delete least recently used entries until the directory fits into max_bytes.
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # removed by another worker
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        # The newest entry is always kept
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
 def qasm_to_map(filename):
 
     with open(filename, 'r') as file:
@@ -638,9 +1863,113 @@ def write_data(data, path, file_name):
         for sublist in data:
         # 将每个子列表转换为 JSON 格式的字符串，并写入文件
             file.write(json.dumps(sublist) + '\n')
-def write_data_json(data, path, file_name):
-    with open(os.path.join(path,file_name), 'w') as file:
-        file.write(json.dumps(data) + '\n')
+EMBEDDING_STORE_MAGIC = b'DASEMB\x00\x01'
+_STORE_ALIGNMENT = 64
+
+def _small_uint_dtype(max_value: int) -> np.dtype:
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+def write_embedding_store(file_path, embeddings, partition_gates, Rb, grid_size, gates_digest):
+    """
+    Save embeddings and partitions in the binary embedding store format.
+
+    Layout: magic, header length (uint32 little endian), JSON header, then three
+    64-byte aligned little-endian arrays: the (partitions, qubits, 2) coordinates,
+    the partition offsets (int64, partitions + 1) and the (gates, 2) qubit pairs of
+    all partitions. The header holds Rb, the grid size, the circuit hash and the
+    dtype, shape and byte offset of every array. The file is written atomically.
+
+    Parameters:
+    file_path (str): Output file.
+    embeddings (list[Embedding]): Embedding of every partition.
+    partition_gates (list[list[list[int]]]): Gates of every partition.
+    Rb (float): Interaction radius.
+    grid_size (int): Grid size the embeddings live on.
+    gates_digest (str): gate_list_digest of the circuit.
+    """
+    coords = np.stack([np.asarray(Embedding(embedding), dtype=np.int64) for embedding in embeddings]) \
+        if len(embeddings) else np.zeros((0, 0, 2), dtype=np.int64)
+    pairs = np.asarray([gate for gates in partition_gates for gate in gates], dtype=np.int64).reshape(-1, 2)
+    offsets = np.zeros(len(partition_gates) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(gates) for gates in partition_gates])
+    arrays = {
+        'embeddings': coords.astype(_small_uint_dtype(int(coords.max(initial=0))).newbyteorder('<')),
+        'offsets': offsets.astype('<i8'),
+        'pairs': pairs.astype(_small_uint_dtype(int(pairs.max(initial=0))).newbyteorder('<')),
+    }
+    header = {'version': 1, 'Rb': Rb, 'grid_size': int(grid_size), 'circuit_hash': gates_digest, 'arrays': {}}
+    # Array offsets depend on the header length, so lay out twice until it is stable
+    data_start = 0
+    while True:
+        position = data_start
+        for name, array in arrays.items():
+            header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': position}
+            position += -(-array.nbytes // _STORE_ALIGNMENT) * _STORE_ALIGNMENT
+        header_bytes = json.dumps(header).encode()
+        needed = -(-(len(EMBEDDING_STORE_MAGIC) + 4 + len(header_bytes)) // _STORE_ALIGNMENT) * _STORE_ALIGNMENT
+        if needed == data_start:
+            break
+        data_start = needed
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(EMBEDDING_STORE_MAGIC)
+            file.write(len(header_bytes).to_bytes(4, 'little'))
+            file.write(header_bytes)
+            for name, array in arrays.items():
+                file.seek(header['arrays'][name]['offset'])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.truncate(position)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class EmbeddingStore:
+    """
+    Read-only view of a binary embedding store. The arrays are memory-mapped
+    slices of the file, so loading does not read or copy the data.
+
+    Attributes:
+    Rb, grid_size, circuit_hash: Header fields.
+    embeddings (np.ndarray): (partitions, qubits, 2) coordinates.
+    offsets (np.ndarray): Partition p holds pairs[offsets[p]:offsets[p + 1]].
+    pairs (np.ndarray): (gates, 2) qubit pairs of all partitions.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        raw = np.memmap(file_path, dtype=np.uint8, mode='r')
+        magic_end = len(EMBEDDING_STORE_MAGIC)
+        if raw[:magic_end].tobytes() != EMBEDDING_STORE_MAGIC:
+            raise ValueError(f"{file_path} is not an embedding store")
+        header_length = int.from_bytes(raw[magic_end:magic_end + 4].tobytes(), 'little')
+        header = json.loads(raw[magic_end + 4:magic_end + 4 + header_length].tobytes())
+        self.Rb = header['Rb']
+        self.grid_size = header['grid_size']
+        self.circuit_hash = header['circuit_hash']
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            view = raw[spec['offset']:spec['offset'] + count * dtype.itemsize].view(dtype)
+            setattr(self, name, view.reshape(spec['shape']))
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def partition(self, index: int) -> np.ndarray:
+        return self.pairs[self.offsets[index]:self.offsets[index + 1]]
+
+    def partition_gates(self) -> list[list[list[int]]]:
+        return [self.partition(p).tolist() for p in range(len(self.offsets) - 1)]
+
+def load_embedding_store(file_path: str) -> EmbeddingStore:
+    return EmbeddingStore(file_path)
 
 def read_data(path, file_name):
     with open(os.path.join(path,file_name), 'r') as file:
@@ -1,5 +1,10 @@
 import math
-from networkx import maximal_independent_set, Graph
+import random
+from collections import deque
+from collections.abc import Iterator
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 
 
 def compatible_2D(a: list[int], b: list[int]) -> bool:
@@ -37,92 +42,161 @@ def compatible_2D(a: list[int], b: list[int]) -> bool:
 
     return True
 
-def maximalis_solve_sort(n: int, edges: list[tuple[int]], nodes: set[int]) -> list[int]:
+def violation_matrix(moves: np.ndarray) -> np.ndarray:
     """
-    Finds a maximal independent set from the given graph nodes using a sorted approach.
+    Evaluates the compatible_2D rules for all pairs of moves at once.
+
+    Two moves are compatible along an axis exactly when their relative order on that
+    axis (before, after) is the same: both smaller, both equal or both larger.
 
     Parameters:
-    n (int): Number of nodes in the graph. The nodes were expressed by integers from 0 to n-1.
-    edges (list[tuple[int]]): list of edges in the graph, where each edge is a tuple of two nodes.
-    nodes (set[int]): Set of nodes to consider for the maximal independent set.
+    moves (np.ndarray): An (M, 4) array of moves ordered as [x_loc_before, y_loc_before, x_loc_after, y_loc_after].
 
     Returns:
-    list[int]: list of nodes in the maximal independent set.
+    np.ndarray: An (M, M) boolean matrix, True where two moves are not compatible.
     """
-    # Initialize conflict status for each node
-    is_node_conflict = [False for _ in range(n)]
-    
-    # Create a dictionary to store neighbors of each node
-    node_neighbors = {i: [] for i in range(n)}
-    
-    # Populate the neighbors dictionary
-    for edge in edges:
-        node_neighbors[edge[0]].append(edge[1])
-        node_neighbors[edge[1]].append(edge[0])
-    
-    result = []
-    for i in nodes:
-        if is_node_conflict[i]:
-            continue
-        else:
-            result.append(i)
-            for j in node_neighbors[i]:
-                is_node_conflict[j] = True
-    return result
+    moves = np.asarray(moves).reshape(-1, 4)
+    before_x = np.sign(moves[:, None, 0] - moves[None, :, 0])
+    after_x = np.sign(moves[:, None, 2] - moves[None, :, 2])
+    before_y = np.sign(moves[:, None, 1] - moves[None, :, 1])
+    after_y = np.sign(moves[:, None, 3] - moves[None, :, 3])
+    return (before_x != after_x) | (before_y != after_y)
 
-def maximalis_solve(nodes:list[int], edges:list[tuple[int]])-> list[int]:
+class ConflictBitsets:
     """
-    Wrapper function to find a maximal independent set using the Graph class.
-
-    Parameters:
-    n (int): Number of nodes in the graph. The nodes were expressed by integers from 0 to n-1.
-    edges (list[tuple[int]]): list of edges in the graph.
+    Conflict graph of the pending moves kept as one integer bitset per move.
 
-    Returns:
-    list[int]: list of nodes in the maximal independent set.
+    Bit i of a bitset refers to the i-th move in the priority order given at construction.
+    Resolved moves are cleared from the bitsets in place, so the conflicts between the
+    remaining moves never have to be rebuilt.
     """
-    G = Graph()
-    for i in nodes:
-        G.add_node(i)
-    for edge in edges:
-        G.add_edge(edge[0], edge[1])
-    
-    # Use a library function to find the maximal independent set
-    result = maximal_independent_set(G, seed=0) 
-    return result
-
-def get_movements(current_map: list, next_map: list, window_size=None) -> map:
+    def __init__(self, keys: list[int], conflicts: np.ndarray) -> None:
+        """
+        Parameters:
+        keys (list[int]): Qubits with a pending move, sorted by priority.
+        conflicts (np.ndarray): (M, M) boolean matrix, True where two moves are not compatible.
+        """
+        self.keys = list(keys)
+        self.position = {qubit: i for i, qubit in enumerate(self.keys)}
+        self.remaining = (1 << len(self.keys)) - 1
+        conflicts = np.asarray(conflicts, dtype=bool).reshape(len(self.keys), len(self.keys))
+        packed = np.packbits(conflicts, axis=1, bitorder="little")
+        self.neighbors = [
+            int.from_bytes(row.tobytes(), "little") & ~(1 << i) for i, row in enumerate(packed)
+        ]
+
+    def __bool__(self) -> bool:
+        return self.remaining != 0
+
+    def _bits(self, mask: int):
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def pending(self) -> list[int]:
+        """Qubits that still have to move, in priority order."""
+        return [self.keys[i] for i in self._bits(self.remaining)]
+
+    def conflicting(self, qubit: int) -> list[int]:
+        """Pending qubits whose moves conflict with the move of `qubit`."""
+        return [self.keys[j] for j in self._bits(self.neighbors[self.position[qubit]])]
+
+    def greedy_stage(self) -> list[int]:
+        """
+        Maximal independent set taken greedily in priority order: every move that does
+        not conflict with a move already in the stage is added.
+        """
+        stage = []
+        available = self.remaining
+        while available:
+            low = available & -available
+            i = low.bit_length() - 1
+            stage.append(self.keys[i])
+            available &= ~(self.neighbors[i] | low)
+        return stage
+
+    def random_stage(self, seed: int = 0) -> list[int]:
+        """
+        Maximal independent set chosen at random. With the same seed this reproduces
+        networkx.maximal_independent_set(G, seed=seed) on the graph of the pending moves.
+        """
+        rng = random.Random(seed)
+        nodes = self.pending()
+        first = rng.choice(nodes)
+        neighbors = set(self.conflicting(first))
+        stage = [first]
+        available = set(nodes).difference(neighbors.union({first}))
+        while available:
+            qubit = rng.choice(list(available))
+            stage.append(qubit)
+            available.difference_update(self.conflicting(qubit) + [qubit])
+        return stage
+
+    def resolve(self, qubit: int) -> None:
+        """Remove the move of `qubit` and all of its conflicts."""
+        i = self.position[qubit]
+        bit = 1 << i
+        self.remaining &= ~bit
+        for j in self._bits(self.neighbors[i]):
+            self.neighbors[j] &= ~bit
+        self.neighbors[i] = 0
+
+def get_movements(current_map, next_map, window_size=None) -> map:
     """
     Determines the movements of qubits between two maps.
 
     Parameters:
-    current_map (list): list of current positions of qubits.
-    next_map (list): list of next positions of qubits.
+    current_map: (num_qubits, 2) array-like of current positions of qubits.
+    next_map: (num_qubits, 2) array-like of next positions of qubits.
     window_size (optional): Size of the window for movement calculations.
 
     Returns:
     map: A dictionary with qubit movements.
     """
-    movements = {}
+    current_map = np.asarray(current_map)
+    next_map = np.asarray(next_map)
     # Determine movements of qubits
-    for qubit, current_position in enumerate(current_map):
-        next_position = next_map[qubit]
-        if current_position != next_position:
-            move_details = current_position + next_position
-            movements[qubit] = move_details
-    return movements
+    moved = np.flatnonzero((current_map != next_map).any(axis=1))
+    move_details = np.hstack([current_map[moved], next_map[moved]]).tolist()
+    return {qubit: tuple(move) for qubit, move in zip(moved.tolist(), move_details)}
+
+def route_transition(task: tuple) -> list[list]:
+    """
+    Resolve the movements of a single transition between two embeddings.
+    Module-level so it can be shipped to worker processes.
+
+    Parameters:
+    task (tuple): (num_qubits, current_map, next_map, arch_size, routing_strategy, mis_seed).
+
+    Returns:
+    list[list]: movement sequences of the transition.
+    """
+    num_qubits, current_map, next_map, arch_size, routing_strategy, mis_seed = task
+    router = QuantumRouter(num_qubits, [current_map, next_map], [[], []], arch_size, routing_strategy, mis_seed)
+    return router.resolve_movements(0)
+
+def route_transitions(tasks: list[tuple]) -> list[list[list]]:
+    """
+    Resolve a batch of transitions (see route_transition) in one worker call.
+    """
+    return [route_transition(task) for task in tasks]
 
 class QuantumRouter:
-    def __init__(self, num_qubits: int, embeddings: list[list[list[int]]], gate_list: list[list[int]], arch_size: list[int], routing_strategy: str = "maximalis") -> None:
+    def __init__(self, num_qubits: int, embeddings: list[list[list[int]]], gate_list: list[list[int]], arch_size: list[int], routing_strategy: str = "maximalis", mis_seed: int = 0, workers: int = 1, executor: str = "process") -> None:
         """
         Initialize the QuantumRouter object with the given parameters.
         
         Parameters:
         num_qubits (int): Number of qubits.
-        embeddings (list[list[list[int]]]): Embeddings for the qubits.
+        embeddings (list): Embeddings for the qubits, each a (num_qubits, 2) array-like of locations.
         gate_list (list[list[int]]): list of two-qubit gates.
         arch_size (list[int]): Architecture size as [x, y].
-        routing_strategy (str): Strategy used for routing.
+        routing_strategy (str): Strategy used for routing. "maximalis" picks each stage as a seeded random
+            maximal independent set of the conflicting moves, any other value picks it greedily by move distance.
+        mis_seed (int): Seed of the "maximalis" stage picker; 0 reproduces the historical stages.
+        workers (int): Number of workers used to route the transitions between embeddings; 1 routes sequentially.
+        executor (str): "process" or "thread" pool used when workers > 1.
         """
         self.num_qubits = num_qubits
         self.validate_embeddings(embeddings)
@@ -134,6 +208,10 @@ class QuantumRouter:
         self.validate_architecture_size(arch_size)
         self.arch_size = arch_size
         self.routing_strategy = routing_strategy
+        self.mis_seed = mis_seed
+        assert executor in ("process", "thread"), "executor should be either 'process' or 'thread'."
+        self.workers = max(1, workers)
+        self.executor = executor
         self.movement_list = []
 
     def validate_embeddings(self, embeddings: list[list[list[int]]]) -> None:
@@ -141,12 +219,12 @@ class QuantumRouter:
         Validate the embeddings to ensure they contain locations for all qubits.
         
         Parameters:
-        embeddings (list[list[list[int]]]): Embeddings for the qubits.
+        embeddings: Embeddings for the qubits, each a (num_qubits, 2) array-like.
         """
         for embedding in embeddings:
-            assert len(embedding) == self.num_qubits, f"Each embedding must contain locations for all {self.num_qubits} qubits."
-            for loc in embedding:
-                assert len(loc) == 2, "Each location must be a list containing exactly two coordinates: [x, y]."
+            shape = np.shape(embedding)
+            assert len(shape) >= 1 and shape[0] == self.num_qubits, f"Each embedding must contain locations for all {self.num_qubits} qubits."
+            assert shape[1:] == (2,), "Each location must be a list containing exactly two coordinates: [x, y]."
 
     def validate_architecture_size(self, arch_size: list[int]) -> None:
         """
@@ -165,41 +243,80 @@ class QuantumRouter:
         """
         Process all embeddings to resolve movements and update the program.
         """
-        for current_pos in range(len(self.embeddings) - 1):
-            movements = self.resolve_movements(current_pos)
-            assert len(movements) > 0, "there should be some movements between embeddings"
+        for movements in self.iter_movements():
             self.movement_list.append(movements)
 
-    def solve_violations(self, movements, violations, sorted_keys):
+    def iter_movements(self) -> Iterator[list[list]]:
+        """
+        Yield the movement sequences (move stages) of each transition between consecutive
+        embeddings, in order, without keeping them. Only the transitions being routed
+        are held in memory, so consumers that handle each stage once and drop it run
+        in memory bounded by the largest transition.
+
+        Yields:
+        list[list]: move stages of one transition, each a list of [qubit, (x1, y1), (x2, y2)].
+        """
+        num_transitions = len(self.embeddings) - 1
+        if self.workers > 1 and num_transitions > 1:
+            movement_stream = self.route_in_parallel(num_transitions)
+        else:
+            movement_stream = (self.resolve_movements(current_pos) for current_pos in range(num_transitions))
+        for movements in movement_stream:
+            assert len(movements) > 0, "there should be some movements between embeddings"
+            yield movements
+
+    def route_in_parallel(self, num_transitions: int) -> Iterator[list[list]]:
         """
-        Resolves violations in qubit movements based on the routing strategy.
+        Route the transitions on a pool of workers. Every transition only depends on the
+        two embeddings around it, the results are yielded in transition order. Only a
+        few batches per worker are in flight at any time.
+
+        Parameters:
+        num_transitions (int): Number of transitions to route.
+
+        Yields:
+        list[list]: movement sequences of each transition.
+        """
+        tasks = (
+            (self.num_qubits, np.asarray(self.embeddings[i]), np.asarray(self.embeddings[i + 1]),
+             self.arch_size, self.routing_strategy, self.mis_seed)
+            for i in range(num_transitions)
+        )
+        max_workers = min(self.workers, num_transitions)
+        # Batch the transitions so that the per-task pickling overhead stays small
+        batch_size = 1 if self.executor == "thread" else max(1, min(16, num_transitions // (4 * max_workers)))
+        batches = iter(lambda: list(islice(tasks, batch_size)), [])
+        executor = ThreadPoolExecutor if self.executor == "thread" else ProcessPoolExecutor
+        with executor(max_workers=max_workers) as pool:
+            in_flight = deque(pool.submit(route_transitions, batch) for batch in islice(batches, 2 * max_workers))
+            while in_flight:
+                results = in_flight.popleft().result()
+                for batch in islice(batches, 1):
+                    in_flight.append(pool.submit(route_transitions, batch))
+                yield from results
+
+    def solve_violations(self, movements: dict[int, tuple[int, int, int, int]], conflicts: ConflictBitsets) -> tuple[dict[int, tuple[int, int, int, int]], list[list]]:
+        """
+        Resolves one stage of conflicting qubit movements based on the routing strategy.
 
         Parameters:
         movements (dict): Dictionary of qubit movements.
-        violations (list): list of violations to be resolved.
-        sorted_keys (list): list of qubit keys sorted based on priority.
+        conflicts (ConflictBitsets): Conflicts between the pending movements, updated in place.
 
         Returns:
-        tuple: remaining movements, unresolved violations and movement sequence to finish movement this time
+        tuple: remaining movements and movement sequence to finish movement this time
         """
         if self.routing_strategy == "maximalis":
-            resolution_order = maximalis_solve(sorted_keys, violations)
+            resolution_order = conflicts.random_stage(self.mis_seed)
         else:
-            resolution_order = maximalis_solve_sort(self.num_q, violations, sorted_keys)
-        # print(f'Resolution Order: {resolution_order}')
+            resolution_order = conflicts.greedy_stage()
         move_sequence =[]
         for qubit in resolution_order:
-            sorted_keys.remove(qubit)
-
-            move = movements[qubit]
-            # print(self.momvents)
+            conflicts.resolve(qubit)
+            move = movements.pop(qubit)
             move_sequence.append([qubit,(move[0],move[1]),(move[2],move[3])])
-            # print(f'Move qubit {qubit} from ({move[0]}, {move[1]}) to ({move[2]}, {move[3]})')
-            # Remove resolved violations
-            violations = [v for v in violations if qubit not in v]
-            del movements[qubit]
-        
-        return movements, violations, move_sequence
+
+        return movements, move_sequence
 
     def resolve_movements(self, current_pos: int) -> list[int, tuple[int, int], tuple[int, int]]:
         """
@@ -214,18 +331,18 @@ class QuantumRouter:
         next_pos = current_pos + 1
         movements = get_movements(self.embeddings[current_pos], self.embeddings[next_pos])
         sorted_movements = sorted(movements.keys(), key=lambda k: math.dist(movements[k][:2], movements[k][2:]))
-        violations = self.check_violations(sorted_movements, movements)
-        move_sequences = self.handle_violations(violations, movements, sorted_movements, current_pos)
+        moves = np.array([movements[qubit] for qubit in sorted_movements])
+        conflicts = ConflictBitsets(sorted_movements, violation_matrix(moves))
+        move_sequences = self.handle_violations(conflicts, movements, current_pos)
         return move_sequences
 
-    def handle_violations(self, violations: list[tuple[int, int]], remained_mov_map: dict[int, tuple[int, int, int, int]], sorted_movements: list[int], current_pos: int) -> list[int, tuple[int, int], tuple[int, int]]:
+    def handle_violations(self, conflicts: ConflictBitsets, remained_mov_map: dict[int, tuple[int, int, int, int]], current_pos: int) -> list[int, tuple[int, int], tuple[int, int]]:
         """
         Handle violations and return the movement sequence accordingly.
         
         Parameters:
-        violations (list[tuple[int, int]]): list of violations.
-        movements (dict[int, tuple[int, int, int, int]]): Movements between embeddings.
-        sorted_movements (list[int]): Sorted list of movements.
+        conflicts (ConflictBitsets): Conflicts between the movements.
+        remained_mov_map (dict[int, tuple[int, int, int, int]]): Movements between embeddings.
         current_pos (int): The current position in the embeddings list.
         
         Returns:
@@ -233,29 +350,11 @@ class QuantumRouter:
         """
         movement_sequence =[]
         while remained_mov_map:
-            remained_mov_map, violations, movement = self.solve_violations(remained_mov_map, violations, sorted_movements)
+            remained_mov_map, movement = self.solve_violations(remained_mov_map, conflicts)
             movement_sequence.append(movement)
 
         return movement_sequence
 
-    def check_violations(self, sorted_movements: list[int], remained_mov_map: dict[int, tuple[int, int, int, int]]) -> list[tuple[int, int]]:
-        """
-        Check for violations between movements.
-        
-        Parameters:
-        sorted_movements (list[int]): Sorted list of movements.
-        movements (dict[int, tuple[int, int, int, int]]): Movements between embeddings.
-        
-        Returns:
-        list[tuple[int, int]]: list of violations.
-        """
-        violations = []
-        for i in range(len(sorted_movements)):
-            for j in range(i + 1, len(sorted_movements)):
-                if not compatible_2D(remained_mov_map[sorted_movements[i]], remained_mov_map[sorted_movements[j]]):
-                    violations.append((sorted_movements[i], sorted_movements[j]))
-        return violations
-
     def run(self) -> None:
         """
         Run the QuantumRouter to initialize, process embeddings.
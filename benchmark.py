@@ -0,0 +1,207 @@
+"""
+Compile-performance regression benchmark for DasAtom.
+
+Runs a fixed selection of circuits from Data/ at fixed interaction radii, records
+per-stage run time, peak memory and result quality, and compares them with a stored
+baseline. Every circuit runs in a fresh process so that its peak RSS is its own.
+
+    python benchmark.py                      # run the suite, exit with 1 on regressions
+    python benchmark.py --update_baseline    # record the current results as the baseline
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# (circuit folder, QASM file, interaction radius Rb)
+BENCHMARK_SUITE = [
+    ('Data/qiskit-bench/qft', 'qft_10.qasm', 2),
+    ('Data/qiskit-bench/qft', 'qft_15.qasm', 2),
+    ('Data/qiskit-bench/qft', 'qft_15.qasm', 3),
+    ('Data/qiskit-bench/quantum_volume', 'quantum_volume_10.qasm', 2),
+    ('Data/mqt-bench/DJ', 'dj_indep_qiskit_10.qasm', 2),
+    ('Data/mqt-bench/GHZ', 'ghz_indep_qiskit_10.qasm', 2),
+    ('Data/mqt-bench/Wstate', 'wstate_indep_qiskit_12.qasm', 2),
+    ('Data/mqt-bench/two_local_random', 'twolocalrandom_indep_qiskit_10.qasm', 2),
+    ('Data/Q_Tetris', '4gt13_92.qasm', 2),
+    ('Data/Q_Tetris', 'rd53_130.qasm', 2),
+    ('Data/Q_Tetris', 'ising_model_10.qasm', 3),
+    ('Data/3_regular_graph', '3_regular_10.qasm', 2),
+    ('Data/3_regular_graph', '3_regular_20.qasm', 2),
+]
+
+# Result-quality metrics and whether a larger value is better
+QUALITY_METRICS = {
+    'partitions': False,
+    'move_stages': False,
+    'total_move_distance': False,
+    'fidelity': True,
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def benchmark_key(folder: str, qasm_file: str, interaction_radius: int) -> str:
+    return f"{folder}/{qasm_file}@Rb{interaction_radius}"
+
+
+def run_circuit(folder: str, qasm_file: str, interaction_radius: int) -> dict:
+    """
+    Compile one circuit with profiling enabled and collect its metrics.
+
+    :param folder: Folder of the QASM file, relative to the repository root.
+    :param qasm_file: Name of the QASM file.
+    :param interaction_radius: The interaction radius (Rb).
+    :return: Stage timings (s), peak RSS (KiB), counters and quality metrics.
+    """
+    from DasAtom import SingleFileProcessor, SUMMARY_HEADER
+    from DasAtom_fun import profiler
+
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = SingleFileProcessor(
+            qasm_filename=qasm_file,
+            circuit_folder=folder,
+            benchmark_name='benchmark',
+            interaction_radius=interaction_radius,
+            extended_radius=2 * interaction_radius,
+            result_path=tmp,
+            embeddings_path=tmp,
+            read_embeddings=False,
+            save_partitions_and_embeddings=False,
+            save_circuit_results=False,
+            save_benchmark_results=False,
+            profile=True
+        )
+        row = dict(zip(SUMMARY_HEADER, processor.process_qasm_file()))
+    report = profiler.report()
+    return {
+        'total_seconds': row['Elapsed Time (s)'],
+        'stage_seconds': {name: stage['seconds'] for name, stage in report['stages'].items()},
+        'peak_rss_kb': report['peak_rss_kb'],
+        'counters': report['counters'],
+        'partitions': row['Num Partitions'],
+        'move_stages': row['Num Movement Ops'],
+        'total_move_distance': row['Total Move Distance'],
+        'fidelity': row['Fidelity'],
+    }
+
+
+def run_suite(suite, repeat: int = 1) -> dict:
+    """
+    Run every benchmark of the suite, each repetition in a fresh process.
+    Timings keep the fastest repetition, memory the lowest peak.
+
+    :param suite: List of (folder, QASM file, Rb).
+    :param repeat: Number of repetitions per circuit.
+    :return: {benchmark key: metrics}
+    """
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for folder, qasm_file, interaction_radius in suite:
+        key = benchmark_key(folder, qasm_file, interaction_radius)
+        print(f"Running: {key}", flush=True)
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                runs.append(pool.submit(run_circuit, folder, qasm_file, interaction_radius).result())
+        best = min(runs, key=lambda r: r['total_seconds'])
+        best['peak_rss_kb'] = min(r['peak_rss_kb'] for r in runs) if best['peak_rss_kb'] is not None else None
+        results[key] = best
+    return results
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, time_slack: float,
+            memory_tolerance: float, quality_tolerance: float) -> list[str]:
+    """
+    Compare benchmark results with the baseline.
+
+    :param results: {benchmark key: metrics} of this run.
+    :param baseline: {benchmark key: metrics} of the baseline.
+    :param time_tolerance: Allowed relative slowdown of the total and per-stage times.
+    :param time_slack: Allowed absolute slowdown in seconds, on top of the relative one.
+    :param memory_tolerance: Allowed relative growth of the peak RSS.
+    :param quality_tolerance: Allowed relative degradation of the quality metrics.
+    :return: A description of every regression found.
+    """
+    regressions = []
+    for key, current in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            print(f"  {key}: no baseline entry, skipped")
+            continue
+        for metric, higher_is_better in QUALITY_METRICS.items():
+            now, before = current[metric], reference[metric]
+            if higher_is_better:
+                worse = now < before - abs(before) * quality_tolerance - 1e-12
+            else:
+                worse = now > before + abs(before) * quality_tolerance + 1e-12
+            if worse:
+                regressions.append(f"{key}: {metric} {before} -> {now}")
+        timings = [('total', current['total_seconds'], reference['total_seconds'])]
+        for stage, seconds in current['stage_seconds'].items():
+            if stage in reference['stage_seconds']:
+                timings.append((stage, seconds, reference['stage_seconds'][stage]))
+        for stage, now, before in timings:
+            if now > before * (1 + time_tolerance) + time_slack:
+                regressions.append(f"{key}: {stage} time {before:.3f}s -> {now:.3f}s")
+        if current['peak_rss_kb'] and reference['peak_rss_kb']:
+            if current['peak_rss_kb'] > reference['peak_rss_kb'] * (1 + memory_tolerance):
+                regressions.append(f"{key}: peak RSS {reference['peak_rss_kb']} KiB -> {current['peak_rss_kb']} KiB")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict) -> None:
+    print(f"{'benchmark':72} {'time (s)':>16} {'partitions':>12} {'stages':>10} {'fidelity':>12}")
+    for key, current in results.items():
+        reference = baseline.get(key)
+        before = f"{reference['total_seconds']:.2f}/" if reference else ""
+        print(f"{key:72} {before + format(current['total_seconds'], '.2f'):>16} "
+              f"{current['partitions']:>12} {current['move_stages']:>10} {current['fidelity']:>12.6f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the DasAtom compile-performance regression benchmark.")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="Baseline JSON file (default: benchmark_baseline.json).")
+    parser.add_argument("--update_baseline", action="store_true", default=False, help="Store the results of this run as the new baseline.")
+    parser.add_argument("--filter", type=str, default=None, help="Only run the benchmarks whose key contains this string.")
+    parser.add_argument("--repeat", type=int, default=1, help="Repetitions per circuit; the fastest one is kept (default=1).")
+    parser.add_argument("--time_tolerance", type=float, default=0.5, help="Allowed relative slowdown (default=0.5).")
+    parser.add_argument("--time_slack", type=float, default=0.05, help="Allowed absolute slowdown in seconds (default=0.05).")
+    parser.add_argument("--memory_tolerance", type=float, default=0.25, help="Allowed relative peak RSS growth (default=0.25).")
+    parser.add_argument("--quality_tolerance", type=float, default=1e-6, help="Allowed relative quality degradation (default=1e-6).")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    suite = [entry for entry in BENCHMARK_SUITE if args.filter is None or args.filter in benchmark_key(*entry)]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+
+    results = run_suite(suite, repeat=args.repeat)
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'environment': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpu_count': os.cpu_count(),
+                },
+                'benchmarks': baseline
+            }, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.time_tolerance, args.time_slack,
+                          args.memory_tolerance, args.quality_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regression(s) in {len(results)} benchmark(s)")
+    sys.exit(1 if regressions else 0)
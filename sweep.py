@@ -0,0 +1,249 @@
+"""
+Parameter sweep over the interaction radius and the embedding hyper-parameters.
+
+Every circuit is parsed and layered once, and partitioned once per interaction
+radius. The (circuit, settings) compiles are then fanned out over worker processes,
+which receive the read-only gate arrays and the partitions once when they start
+(shared copy-on-write where processes are forked). The results form one tidy table
+with a row per (circuit, settings).
+
+    python sweep.py qft Data/qiskit-bench/qft --interaction_radius 2 3 \
+        --max_candidates 20 50 --idle_weight 0.1 0.3 --jobs 4
+"""
+import os
+import math
+import itertools
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from DasAtom import DasAtom, SingleFileProcessor, SUMMARY_HEADER
+from DasAtom_fun import (Architecture, CompileCache, LayeredCircuit, gate_list_digest, open_result_sink,
+                         partition_from_layers, resolve_embedding_options)
+
+# Parsed circuits of the sweep by QASM file and their partitions by (QASM file, Rb),
+# set once per worker process
+_circuits = {}
+_partitions = {}
+
+
+def _init_worker(circuits: dict, partitions: dict = None) -> None:
+    global _circuits, _partitions
+    _circuits = circuits
+    _partitions = partitions or {}
+
+
+def settings_grid(interaction_radius=(2,), **embedding_axes) -> list[dict]:
+    """
+    Build the cartesian product of the swept values.
+
+    :param interaction_radius: Values of the interaction radius (Rb).
+    :param embedding_axes: Values of get_embeddings hyper-parameters by name, e.g. max_candidates=[20, 50].
+    :return: One dict per setting: the interaction radius and every embedding option (defaults filled in).
+             Options a setting does not use are reset to their defaults, so settings that would
+             compile identically appear once.
+    """
+    names = list(embedding_axes)
+    defaults = resolve_embedding_options()
+    grid = []
+    for interaction_radius_value in interaction_radius:
+        for values in itertools.product(*embedding_axes.values()):
+            options = resolve_embedding_options(**dict(zip(names, values)))
+            if not options['optimize_movement']:
+                # Without movement optimization the first mapping found is taken
+                options = {**defaults, 'optimize_movement': False}
+            elif options['search_strategy'] != 'bnb':
+                options['expansion_budget'] = defaults['expansion_budget']
+            settings = {'interaction_radius': interaction_radius_value, **options}
+            if settings not in grid:
+                grid.append(settings)
+    return grid
+
+
+def sweep_header() -> list[str]:
+    return ['QASM File', 'Rb', 'Re'] + list(resolve_embedding_options()) + SUMMARY_HEADER[1:]
+
+
+def partition_circuit(qasm_file: str, interaction_radius: int, cache_dir: str = None) -> list:
+    """
+    Partition one circuit of the sweep at one interaction radius, on the initial grid
+    SingleFileProcessor starts from. The compile cache entry of the processor is used
+    and filled when a cache folder is given.
+
+    :param qasm_file: Name of the QASM file, a key of the parsed circuits.
+    :param interaction_radius: The interaction radius (Rb).
+    :param cache_dir: Compile cache folder (None disables the cache).
+    :return: A list of partitioned gates.
+    """
+    circuit = _circuits[qasm_file]
+    architecture = Architecture(math.ceil(math.sqrt(circuit.num_qubits)), interaction_radius)
+    cache = cache_key = None
+    if cache_dir is not None:
+        cache = CompileCache(cache_dir)
+        cache_key = CompileCache.key(
+            'partitions', gate_list_digest(circuit.gates), Rb=interaction_radius, grid_size=architecture.arch_size
+        )
+        partitioned_gates = cache.get(cache_key)
+        if partitioned_gates is not None:
+            return partitioned_gates
+    partitioned_gates = partition_from_layers(circuit.layers(), architecture)
+    if cache is not None:
+        cache.put(cache_key, partitioned_gates)
+    return partitioned_gates
+
+
+def run_setting(qasm_file: str, settings: dict, processor_settings: dict) -> list:
+    """
+    Compile one circuit of the sweep with one setting.
+
+    :param qasm_file: Name of the QASM file, a key of the parsed circuits.
+    :param settings: One entry of settings_grid.
+    :param processor_settings: Keyword arguments shared by every SingleFileProcessor.
+    :return: The tidy row: file, Rb, Re, embedding options and the summary metrics.
+    """
+    interaction_radius = settings['interaction_radius']
+    embedding_options = resolve_embedding_options(
+        **{name: value for name, value in settings.items() if name != 'interaction_radius'}
+    )
+    row = SingleFileProcessor(
+        qasm_filename=qasm_file,
+        interaction_radius=interaction_radius,
+        extended_radius=2 * interaction_radius,
+        embedding_options=embedding_options,
+        circuit=_circuits[qasm_file],
+        partitions=_partitions.get((qasm_file, interaction_radius)),
+        **processor_settings
+    ).process_qasm_file()
+    values = {'QASM File': qasm_file, 'Rb': interaction_radius, 'Re': 2 * interaction_radius,
+              **embedding_options, **dict(zip(SUMMARY_HEADER[1:], row[1:]))}
+    return [values[name] for name in sweep_header()]
+
+
+def run_sweep(
+    benchmark_name: str,
+    circuit_folder: str,
+    grid: list[dict],
+    qasm_files: list[str] = None,
+    results_folder: str = None,
+    jobs: int = 1,
+    use_cache: bool = True,
+    result_format: str = "csv"
+) -> list[list]:
+    """
+    Compile every circuit of a folder with every setting of the grid.
+
+    :param benchmark_name: Name of the benchmark (used in output naming).
+    :param circuit_folder: Path containing the QASM files.
+    :param grid: Settings to compile with, see settings_grid.
+    :param qasm_files: Files to sweep (default: every .qasm file of the folder).
+    :param results_folder: Output folder (defaults to 'res/{benchmark_name}/sweep').
+    :param jobs: Number of worker processes (1 = sequential).
+    :param use_cache: If True, keep partitions/embeddings in the compile cache of the results folder,
+                      so a repeated or extended sweep reuses them.
+    :param result_format: Format of the results table: "xlsx", "csv" or "jsonl".
+    :return: The table rows, in (circuit, settings) order.
+    """
+    assert os.path.exists(circuit_folder), f"Directory not found: {circuit_folder}"
+    if results_folder is None:
+        results_folder = f"res/{benchmark_name}/sweep"
+    os.makedirs(results_folder, exist_ok=True)
+    if qasm_files is None:
+        qasm_files = sorted((f for f in os.listdir(circuit_folder) if f.endswith('.qasm')),
+                            key=DasAtom._extract_numeric_suffix)
+
+    # Parse and layer every circuit once
+    circuits = {}
+    for qasm_file in qasm_files:
+        print(f"Parsing: {qasm_file}")
+        circuits[qasm_file] = LayeredCircuit.from_qasm(qasm_file, circuit_folder)
+
+    processor_settings = dict(
+        circuit_folder=circuit_folder,
+        benchmark_name=benchmark_name,
+        result_path=results_folder,
+        embeddings_path=results_folder,
+        read_embeddings=False,
+        save_partitions_and_embeddings=False,
+        save_circuit_results=False,
+        save_benchmark_results=False,
+        cache_dir=os.path.join(results_folder, "cache") if use_cache else None
+    )
+    cache_dir = processor_settings['cache_dir']
+
+    # Partition every circuit once per interaction radius; the partitions are then shared by its settings
+    groups = list(dict.fromkeys(
+        (qasm_file, settings['interaction_radius']) for qasm_file in qasm_files for settings in grid
+    ))
+    print(f"Partitioning: {len(groups)} (circuit, Rb) pairs")
+    if jobs > 1 and len(groups) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(groups)), initializer=_init_worker,
+                                 initargs=(circuits,)) as pool:
+            partitions = dict(zip(groups, pool.map(
+                partition_circuit, *zip(*groups), [cache_dir] * len(groups)
+            )))
+    else:
+        _init_worker(circuits)
+        partitions = {group: partition_circuit(*group, cache_dir) for group in groups}
+
+    tasks = [(qasm_file, settings) for qasm_file in qasm_files for settings in grid]
+    rows = []
+    sink = open_result_sink(os.path.join(results_folder, f'{benchmark_name}_sweep'), result_format)
+    try:
+        sink.write_row(sweep_header())
+        if jobs > 1 and len(tasks) > 1:
+            # Rows are written by this process only, in task order, as soon as all preceding tasks are done
+            finished_rows = {}
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=_init_worker,
+                                     initargs=(circuits, partitions)) as pool:
+                futures = {pool.submit(run_setting, qasm_file, settings, processor_settings): i
+                           for i, (qasm_file, settings) in enumerate(tasks)}
+                for future in as_completed(futures):
+                    finished_rows[futures[future]] = future.result()
+                    while len(rows) in finished_rows:
+                        rows.append(finished_rows.pop(len(rows)))
+                        sink.write_row(rows[-1])
+        else:
+            _init_worker(circuits, partitions)
+            for qasm_file, settings in tasks:
+                print(f"Processing: {qasm_file} {settings}")
+                rows.append(run_setting(qasm_file, settings, processor_settings))
+                sink.write_row(rows[-1])
+    finally:
+        sink.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep DasAtom over interaction radii and embedding hyper-parameters.")
+
+    parser.add_argument("benchmark_name", type=str, help="Name of the benchmark.")
+    parser.add_argument("circuit_folder", type=str, help="Path to the folder containing .qasm files.")
+    parser.add_argument("--results_folder", type=str, help="Folder where the results are stored (default: res/{benchmark_name}/sweep).")
+    parser.add_argument("--interaction_radius", type=int, nargs="+", default=[2], help="Interaction radii (default=2).")
+    parser.add_argument("--max_candidates", type=int, nargs="+", default=[50], help="Numbers of VF2 embedding candidates (default=50).")
+    parser.add_argument("--idle_weight", type=float, nargs="+", default=[0.3], help="Idle qubit weights (default=0.3).")
+    parser.add_argument("--search_strategy", type=str, nargs="+", choices=["vf2", "bnb"], default=["vf2"], help="Embedding search strategies (default=vf2).")
+    parser.add_argument("--expansion_budget", type=int, nargs="+", default=[5000], help="Node expansion budgets of the 'bnb' strategy (default=5000).")
+    parser.add_argument("--optimize_movement", type=int, nargs="+", choices=[0, 1], default=[1], help="Movement optimization off/on (default=1).")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes (default=1).")
+    parser.add_argument("--no_cache", action="store_false", dest="use_cache", help="Do not keep partitions/embeddings in the compile cache.")
+    parser.add_argument("--result_format", type=str, choices=["xlsx", "csv", "jsonl"], default="csv", help="Format of the results table (default=csv).")
+
+    args = parser.parse_args()
+
+    grid = settings_grid(
+        interaction_radius=args.interaction_radius,
+        optimize_movement=[bool(value) for value in args.optimize_movement],
+        max_candidates=args.max_candidates,
+        idle_weight=args.idle_weight,
+        search_strategy=args.search_strategy,
+        expansion_budget=args.expansion_budget
+    )
+    run_sweep(
+        args.benchmark_name,
+        args.circuit_folder,
+        grid,
+        results_folder=args.results_folder,
+        jobs=args.jobs,
+        use_cache=args.use_cache,
+        result_format=args.result_format
+    )